@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the parser and the importer, fully offline:
+generates a synthetic Jira export (see jira_export.py), parses it with Project,
+then runs the Importer stages against the fake GitHub server (see fake_github.py).
+Reports the time and throughput of each stage and the peak memory.
+
+    python benchmarks/end_to_end.py [--issues N] [--files N] [--processes N] [--latency S]
+        [--import-delay S] [--rate-limit N] [--rate-window S] [--keep DIR] [--verbose]
+
+All files (export, checkpoint, key map, metrics report) go to a temporary
+directory, or to --keep DIR to look at them afterwards.
+"""
+import argparse
+import contextlib
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_github  # noqa: E402
+import jira_export  # noqa: E402
+
+
+def peak_rss_mb():
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+
+
+def run(args, work_dir):
+    github = fake_github.FakeGitHub(args.latency, args.import_delay, args.rate_limit, args.rate_window)
+    server = fake_github.start_server(github)
+    # read when the modules are imported
+    os.environ['JIRA_MIGRATION_GITHUB_API_URL'] = fake_github.api_url(server)
+    os.environ['JIRA_MIGRATION_METRICS'] = os.path.join(work_dir, 'metrics.json')
+    os.chdir(work_dir)
+
+    from checkpoint import ImportCheckpoint
+    from importer import Importer
+    from labelcolourselector import LabelColourSelector
+    from metrics import metrics
+    from project import Project
+
+    # several files, so the parse stage can use a process pool
+    export = os.path.join(work_dir, 'export')
+    start = time.perf_counter()
+    jira_export.write_exports(export, args, args.files)
+    size = sum(entry.stat().st_size for entry in os.scandir(export))
+    print('Generated %d issues in %d files (%.1f MB) in %.2fs'
+          % (args.issues, args.files, size / 1e6, time.perf_counter() - start))
+
+    project = Project(jira_export.PROJECT, '3', 'https://issues.example.org')
+    checkpoint = ImportCheckpoint(os.path.join(work_dir, 'checkpoint.sqlite'))
+    options = namedtuple('Options', 'accesstoken account repo')('token', 'bench', 'bench')
+    importer = Importer(options, project, checkpoint)
+    stages = []
+
+    def stage(name, func):
+        start = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            func()
+        stages.append((name, time.perf_counter() - start))
+
+    stage('parse', lambda: project.add_files(export, processes=args.processes))
+    parse_rss = peak_rss_mb()
+    stage('milestones', importer.import_milestones)
+    stage('labels', lambda: importer.import_labels(LabelColourSelector(project)))
+    stage('issues', importer.import_issues)
+    stage('post-process', importer.post_process_comments)
+    stage('epic children', importer.link_epic_children)
+    checkpoint_count = len(checkpoint.imported())
+    checkpoint.close()
+    metrics.write()
+    server.shutdown()
+
+    print()
+    print('%-15s %9s %12s' % ('stage', 'seconds', 'issues/s'))
+    for name, seconds in stages:
+        print('%-15s %9.2f %12.1f' % (name, seconds, args.issues / seconds if seconds else 0))
+    print()
+    print('imported: %d of %d issues' % (checkpoint_count, args.issues))
+    print('github calls: %d (%d rate limited)' % (github.calls, github.rate_limited))
+    print('peak memory: %.1f MB after parsing, %.1f MB at the end' % (parse_rss, peak_rss_mb()))
+    report = metrics.report()
+    for name in ('parse', 'transform', 'html', 'upload', 'status', 'http'):
+        if name in report['stages']:
+            stage_report = report['stages'][name]
+            print('%-10s %8d calls, mean %8.3f ms, max %8.1f ms'
+                  % (name, stage_report['count'], stage_report['mean'] * 1e3, stage_report['max'] * 1e3))
+    print('metrics report:', metrics.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of the Jira to GitHub import.')
+    jira_export.add_arguments(parser)
+    fake_github.add_arguments(parser)
+    parser.add_argument('--files', type=int, default=4, help='export files the issues are split over')
+    parser.add_argument('--processes', type=int, default=1, help='parse processes')
+    parser.add_argument('--keep', help='directory for the generated files, kept afterwards')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the importer')
+    args = parser.parse_args()
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        run(args, os.path.abspath(args.keep))
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            run(args, work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the parts of the GitHub API used by the importer: milestones,
+labels, the Issue Import API with its status polling and import list, and listing
+and patching issues and comments. Point the importer at it with JIRA_MIGRATION_GITHUB_API_URL.
+
+    python benchmarks/fake_github.py [--port N] [--latency S] [--import-delay S]
+        [--rate-limit N] [--rate-window S]
+
+Every response is delayed by --latency seconds, an import stays 'pending' for
+--import-delay seconds, and after --rate-limit calls per --rate-window seconds
+calls get the 403 of an exhausted rate limit, with the usual X-RateLimit headers.
+"""
+import argparse
+import calendar
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+_ROUTE = re.compile(r'^/repos/[^/]+/[^/]+(/.*)$')
+
+
+class FakeGitHub:
+    """The in-memory state of one fake repository."""
+
+    def __init__(self, latency=0.0, import_delay=0.0, rate_limit=0, rate_window=60.0):
+        self.latency = latency
+        self.import_delay = import_delay
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.lock = threading.Lock()
+        self.milestones = []
+        self.labels = []
+        self.imports = {}
+        self.issues = {}
+        self.comments = {}
+        self.calls = 0
+        self.rate_limited = 0
+        self._window_start = time.time()
+        self._window_calls = 0
+
+    def rate_limit_headers(self):
+        """Counts a call, returns its X-RateLimit headers and whether it is over the limit."""
+        with self.lock:
+            self.calls += 1
+            if not self.rate_limit:
+                return {}, False
+            now = time.time()
+            if now >= self._window_start + self.rate_window:
+                self._window_start = now
+                self._window_calls = 0
+            self._window_calls += 1
+            remaining = max(self.rate_limit - self._window_calls, 0)
+            limited = self._window_calls > self.rate_limit
+            self.rate_limited += limited
+            return {'X-RateLimit-Limit': str(self.rate_limit),
+                    'X-RateLimit-Remaining': str(remaining),
+                    'X-RateLimit-Reset': str(int(self._window_start + self.rate_window))}, limited
+
+    def create_import(self, base_url, payload):
+        with self.lock:
+            import_id = len(self.imports) + 1
+            number = len(self.issues) + 1
+            issue_url = '%s/issues/%d' % (base_url, number)
+            self.issues[number] = {'number': number, 'url': issue_url, 'body': payload['issue']['body']}
+            for comment in payload.get('comments', []):
+                self._add_comment(base_url, number, comment['body'])
+            self.imports[import_id] = {'id': import_id, 'issue_url': issue_url, 'created_at': time.time(),
+                                       'ready_at': time.time() + self.import_delay,
+                                       'url': '%s/import/issues/%d' % (base_url, import_id)}
+            return {'id': import_id, 'status': 'pending', 'url': self.imports[import_id]['url']}
+
+    def add_comment(self, base_url, number, body):
+        with self.lock:
+            return self._add_comment(base_url, number, body)
+
+    def _add_comment(self, base_url, number, body):
+        comment_id = len(self.comments) + 1
+        comment = {'id': comment_id, 'url': '%s/issues/comments/%d' % (base_url, comment_id),
+                   'issue_url': '%s/issues/%d' % (base_url, number), 'body': body}
+        self.comments[comment_id] = comment
+        return comment
+
+    def import_status(self, import_id):
+        job = self.imports.get(import_id)
+        if job is None:
+            return None
+        if time.time() < job['ready_at']:
+            return {'id': import_id, 'status': 'pending', 'url': job['url']}
+        return {'id': import_id, 'status': 'imported', 'url': job['url'], 'issue_url': job['issue_url']}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait for a delayed ACK
+    disable_nagle_algorithm = True
+    github = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _page(self, items, url, query, headers):
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        start = (page - 1) * per_page
+        if start + per_page < len(items):
+            query = dict(query, page=[str(page + 1)])
+            next_url = '%s?%s' % (url, '&'.join('%s=%s' % (name, values[0]) for name, values in query.items()))
+            headers['Link'] = '<%s>; rel="next"' % next_url
+        self._reply(200, items[start:start + per_page], headers)
+
+    def _handle(self, method):
+        github = self.github
+        # read the body first, the connection is kept alive for the next request
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        time.sleep(github.latency)
+        headers, limited = github.rate_limit_headers()
+        if limited:
+            return self._reply(403, {'message': 'API rate limit exceeded'}, headers)
+
+        url = urlparse(self.path)
+        m = _ROUTE.match(url.path)
+        if not m:
+            return self._reply(404, {'message': 'Not Found'}, headers)
+        base_url = 'http://%s:%d%s' % (self.server.server_address[0], self.server.server_address[1],
+                                       url.path[:len(url.path) - len(m[1])])
+        route, query = m[1], parse_qs(url.query)
+
+        if route in ('/milestones', '/labels'):
+            items = github.milestones if route == '/milestones' else github.labels
+            if method == 'GET':
+                return self._page(items, base_url + route, query, headers)
+            with github.lock:
+                item = dict(body, number=len(items) + 1)
+                items.append(item)
+            return self._reply(201, item, headers)
+        if route == '/import/issues' and method == 'POST':
+            return self._reply(202, github.create_import(base_url, body), headers)
+        if route == '/import/issues' and method == 'GET':
+            since = calendar.timegm(time.strptime(query['since'][0], '%Y-%m-%dT%H:%M:%SZ')) if 'since' in query else 0
+            return self._page([github.import_status(import_id) for import_id, job in list(github.imports.items())
+                               if job['created_at'] >= since], base_url + route, query, headers)
+        if route.startswith('/import/issues/') and method == 'GET':
+            status = github.import_status(int(route.rsplit('/', 1)[1]))
+            return self._reply(404 if status is None else 200, status or {'message': 'Not Found'}, headers)
+        if route == '/issues' and method == 'GET':
+            return self._page(list(github.issues.values()), base_url + route, query, headers)
+        if route == '/issues/comments' and method == 'GET':
+            return self._page(list(github.comments.values()), base_url + route, query, headers)
+        m = re.match(r'^/issues/(?:(comments)/)?(\d+)$', route)
+        if m:
+            item = (github.comments if m[1] else github.issues).get(int(m[2]))
+            if item is None:
+                return self._reply(404, {'message': 'Not Found'}, headers)
+            if method == 'PATCH':
+                item['body'] = body['body']
+            return self._reply(200, item, headers)
+        m = re.match(r'^/issues/(\d+)/comments$', route)
+        if m and method == 'GET':
+            issue_url = '%s/issues/%s' % (base_url, m[1])
+            return self._page([comment for comment in list(github.comments.values()) if comment['issue_url'] == issue_url],
+                              base_url + route, query, headers)
+        if m and method == 'POST':
+            return self._reply(201, github.add_comment(base_url, int(m[1]), body['body']), headers)
+        return self._reply(404, {'message': 'Not Found'}, headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+
+def start_server(github, port=0):
+    """Serves github in a background thread, returns the server; its API url is api_url(server)."""
+    handler = type('Handler', (_Handler,), {'github': github})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def api_url(server):
+    return 'http://%s:%d' % server.server_address
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every response')
+    parser.add_argument('--import-delay', type=float, default=0.5, help='seconds an import stays pending')
+    parser.add_argument('--rate-limit', type=int, default=0, help='calls per rate window, 0 for unlimited')
+    parser.add_argument('--rate-window', type=float, default=60.0, help='seconds of a rate limit window')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake GitHub API for benchmarking the importer.')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = start_server(FakeGitHub(args.latency, args.import_delay, args.rate_limit, args.rate_window), args.port)
+    print('Serving on', api_url(server))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of Project._htmlentitydecode on realistic Jira comment HTML.
+Compares the precompiled JiraHtmlRewriter with the former implementation,
+which is kept below as a reference.
+
+    python benchmarks/htmlentitydecode.py [number of calls]
+"""
+import os
+import re
+import sys
+import timeit
+from html.entities import name2codepoint
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from project import Project  # noqa: E402
+from utils import get_github_search_url  # noqa: E402
+
+JIRA_BASE_URL = 'https://issues.jenkins.io'
+
+COMMENT = ('<p>Thanks for the report &amp; the logs. I could reproduce it on&nbsp;2.387, '
+           'see <a href="https://issues.jenkins.io/browse/INFRA-3141" class="issue-link">INFRA-3141</a> '
+           'and <a href="https://issues.jenkins.io/browse/INFRA-2718">INFRA-2718</a>.</p>\n'
+           '<p><span class="image-wrap" style=""><img src="/rest/api/3/attachment/content/10233" '
+           'width="640" height="480" style="border: 0px solid black" /></span></p>\n'
+           '<div class="code panel" style="border-width: 1px;"><div class="codeContent panelContent">\n'
+           '<pre class="code-java">        <span class="code-keyword">if</span> (a &lt; b &amp;&amp; c &gt; d) {\n'
+           '            <span class="code-keyword">return</span> &quot;ok&quot;;\n        }</pre>\n</div></div>\n'
+           '<p>Video: <object width="400" height="300"><param name="movie" value="x"/>'
+           '<embed src="/rest/api/3/attachment/content/10234?stream=true" width="400" height="300"/></object></p>\n'
+           '<ul>\n<li>first &ndash; item</li>\n<li>second &mdash; item &hellip;</li>\n</ul>\n')
+
+PLAIN_COMMENT = '<p>Deployed the new agent image, the builds are green again. Closing.</p>'
+
+
+def legacy_htmlentitydecode(s, jira_base_url=JIRA_BASE_URL):
+    s = s.replace(' ' * 8, '')
+    s = re.sub(r'(width|height)=".+?"', '', s)
+    s = re.sub(r'<object.+?<embed (.+?)/></object>', lambda m: f'<a {m[1]}>video</a>'.replace(' src=', ' href='), s)
+    s = re.sub(r'/rest/api/3/attachment/content/(\d+[^"]*)', lambda m: m[0], s)
+    s = re.sub(f'"{jira_base_url}/browse/(.+?)"', lambda m: '"' + get_github_search_url(m[1], 'title') + '"', s)
+    return re.sub('&(%s);' % '|'.join(name2codepoint),
+                  lambda m: chr(name2codepoint[m.group(1)]), s)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    project = Project('INFRA', '3', JIRA_BASE_URL)
+    for comment in (COMMENT, PLAIN_COMMENT):
+        assert project._htmlentitydecode(comment) == legacy_htmlentitydecode(comment)
+
+        print('comment size: %d bytes, %d calls' % (len(comment), number))
+        for name, func in (('legacy', legacy_htmlentitydecode), ('precompiled', project._htmlentitydecode)):
+            best = min(timeit.repeat(lambda: func(comment), number=number, repeat=5))
+            print('%12s: %7.2f us per comment' % (name, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Generates a synthetic Jira XML export, shaped like the searchrequest-xml exports
+read by Project, for benchmarking without a Jira server.
+
+    python benchmarks/jira_export.py output.xml [--issues N] [--comments N] [--links N]
+        [--epic-every N] [--attachments N] [--html-paragraphs N] [--files N]
+
+With --files, output is a directory that gets the issues split over that many files.
+"""
+import argparse
+import glob
+import os
+import random
+from html import escape
+
+PROJECT = 'BENCH'
+_WORDS = ('build', 'agent', 'plugin', 'pipeline', 'node', 'timeout', 'release', 'mirror',
+          'update', 'center', 'docker', 'image', 'permission', 'cluster', 'certificate', 'job')
+_STATUSES = (('Open', 2), ('In Progress', 4), ('Resolved', 3), ('Closed', 3), ('Not A Bug', 3))
+_TYPES = ('Bug', 'Improvement', 'New Feature', 'Task', 'Epic')
+_LINKS = (('Relates', 'relates to', 'relates to'), ('Blocker', 'blocks', 'is blocked by'),
+          ('Duplicate', 'duplicates', 'is duplicated by'))
+
+
+def _timestamp(rng):
+    return '%s, %02d %s %d %02d:%02d:%02d +0000' % (
+        rng.choice(('Mon', 'Tue', 'Wed', 'Thu', 'Fri')), rng.randint(1, 28),
+        rng.choice(('Jan', 'Mar', 'Jun', 'Sep', 'Nov')), rng.randint(2015, 2023),
+        rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+
+
+def _sentence(rng, words=12):
+    return ' '.join(rng.choice(_WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _html(rng, key_number, issues, paragraphs, attachments):
+    """Jira rendered HTML: paragraphs with issue links and entities, code panels and attachments."""
+    parts = []
+    for i in range(paragraphs):
+        other = rng.randint(1, issues)
+        parts.append('<p>%s See <a href="https://issues.example.org/browse/%s-%d" class="issue-link">%s-%d</a> '
+                     '&amp; the logs&nbsp;below.</p>' % (_sentence(rng), PROJECT, other, PROJECT, other))
+        if i % 3 == 2:
+            parts.append('<div class="code panel"><div class="codeContent panelContent"><pre class="code-java">'
+                         'if (a &lt; b &amp;&amp; c &gt; d) { return &quot;%s&quot;; }</pre></div></div>'
+                         % rng.choice(_WORDS))
+    for i in range(attachments):
+        parts.append('<p><span class="image-wrap"><img src="/rest/api/3/attachment/content/%d" '
+                     'width="640" height="480" /></span></p>' % (10000 + key_number * 10 + i))
+    return '\n'.join(parts)
+
+
+def _item(rng, number, options):
+    key = '%s-%d' % (PROJECT, number)
+    status, category = rng.choice(_STATUSES)
+    is_epic = options.epic_every and number % options.epic_every == 1
+    issue_type = 'Epic' if is_epic else rng.choice(_TYPES[:-1])
+    created = _timestamp(rng)
+
+    customfields = ['<customfield id="customfield_10940" key="x"><customfieldname>Implementation Strategy'
+                    '</customfieldname><customfieldvalues><customfieldvalue>%s</customfieldvalue>'
+                    '</customfieldvalues></customfield>' % escape(_sentence(rng))]
+    if is_epic:
+        customfields.append('<customfield id="customfield_10001" key="com.pyxis.greenhopper.jira:gh-epic-label">'
+                            '<customfieldname>Epic Name</customfieldname><customfieldvalues>'
+                            '<customfieldvalue>epic-%d</customfieldvalue></customfieldvalues></customfield>' % number)
+    elif options.epic_every:
+        epic = number - (number - 1) % options.epic_every
+        customfields.append('<customfield id="customfield_10002" key="com.pyxis.greenhopper.jira:gh-epic-link">'
+                            '<customfieldname>Epic Link</customfieldname><customfieldvalues>'
+                            '<customfieldvalue>%s-%d</customfieldvalue></customfieldvalues></customfield>'
+                            % (PROJECT, epic))
+
+    comments = ''.join(
+        '<comment id="%d%03d" author="user%d" created="%s">%s</comment>'
+        % (number, i, rng.randint(1, 50), _timestamp(rng),
+           escape(_html(rng, number, options.issues, max(options.html_paragraphs // 2, 1), 0)))
+        for i in range(options.comments))
+
+    links = ''
+    for i in range(options.links):
+        name, outward, inward = _LINKS[i % len(_LINKS)]
+        links += ('<issuelinktype id="%d"><name>%s</name><outwardlinks description="%s"><issuelink>'
+                  '<issuekey id="%d">%s-%d</issuekey></issuelink></outwardlinks></issuelinktype>'
+                  % (i, name, outward, i, PROJECT, rng.randint(1, options.issues)))
+
+    return f'''<item><title>[{key}] {escape(_sentence(rng, 6))}</title><link>https://issues.example.org/browse/{key}</link>
+<project id="1" key="{PROJECT}">Benchmark</project>
+<description>{escape(_html(rng, number, options.issues, options.html_paragraphs, options.attachments))}</description>
+<key id="{number}">{key}</key><summary>{escape(_sentence(rng, 6))}</summary><type id="1">{issue_type}</type>
+<priority id="3">{rng.choice(('Minor', 'Major', 'Critical'))}</priority><status id="1">{status}</status>
+<statusCategory id="{category}" key="x" colorName="green"/><resolution id="1">{'Fixed' if category == 3 else 'Unresolved'}</resolution>
+<assignee accountid="a{number % 17}">{'Unassigned' if number % 5 == 0 else 'user%d' % (number % 17)}</assignee><reporter accountid="r{number % 13}">user{number % 13}</reporter>
+<labels><label>{rng.choice(_WORDS)}</label><label>{rng.choice(_WORDS)}</label></labels>
+<created>{created}</created><updated>{_timestamp(rng)}</updated>{'<resolved>%s</resolved>' % _timestamp(rng) if category == 3 else ''}
+<fixVersion>2.{number % 12}</fixVersion><component>{rng.choice(_WORDS)}</component><votes>0</votes><watches>1</watches>
+<comments>{comments}</comments><issuelinks>{links}</issuelinks><attachments/><subtasks/>
+<customfields>{''.join(customfields)}</customfields>
+</item>
+'''
+
+
+def write_export(file_name, options, first=1, last=None, seed=None):
+    """Writes the issues numbered first to last (default: all) to one export file."""
+    last = options.issues if last is None else last
+    rng = random.Random(options.seed if seed is None else seed)
+    with open(file_name, 'w') as out:
+        out.write('<rss version="0.92"><channel><title>Jira</title>'
+                  '<issue start="%d" end="%d" total="%d"/>\n' % (first - 1, last, options.issues))
+        for number in range(first, last + 1):
+            out.write(_item(rng, number, options))
+        out.write('</channel></rss>\n')
+
+
+def write_exports(directory, options, files):
+    """Writes the issues split over files export files in directory, e.g. to benchmark parsing in parallel."""
+    os.makedirs(directory, exist_ok=True)
+    for stale in glob.glob(os.path.join(directory, 'export-*.xml')):
+        os.remove(stale)
+    per_file = -(-options.issues // files)
+    for index, first in enumerate(range(1, options.issues + 1, per_file)):
+        # zero padded, as the files are read in name order
+        write_export(os.path.join(directory, 'export-%04d.xml' % index), options,
+                     first, min(first + per_file - 1, options.issues), options.seed * 10000 + index)
+
+
+def add_arguments(parser):
+    parser.add_argument('--issues', type=int, default=1000)
+    parser.add_argument('--comments', type=int, default=5, help='comments per issue')
+    parser.add_argument('--links', type=int, default=2, help='issue links per issue')
+    parser.add_argument('--epic-every', type=int, default=25, help='one epic per N issues, 0 for none')
+    parser.add_argument('--attachments', type=int, default=2, help='attachments per description')
+    parser.add_argument('--html-paragraphs', type=int, default=6, help='HTML paragraphs per description')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a synthetic Jira XML export.')
+    parser.add_argument('output')
+    parser.add_argument('--files', type=int, default=1, help='number of export files, written to the output directory')
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.files > 1:
+        write_exports(args.output, args, args.files)
+    else:
+        write_export(args.output, args)
@@ -0,0 +1,142 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class ImportCheckpoint:
+    """
+    Durable record of the import progress, keyed by Jira issue key.
+    Every state change is committed right away, so after a crash or restart
+    finished issues are skipped and pending ones are polled again.
+    The follow-up comments are stored too, as they are added from worker threads.
+    """
+    SUBMITTED = 'submitted'
+    PENDING = 'pending'
+    IMPORTED = 'imported'
+    FAILED = 'failed'
+
+    def __init__(self, path='jira-import-checkpoint.sqlite'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS issues ('
+                            'jira_key TEXT PRIMARY KEY, '
+                            'state TEXT NOT NULL, '
+                            'status_url TEXT, '
+                            'github_id INTEGER, '
+                            'error TEXT, '
+                            'updated_at REAL NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS jira_comments (jira_key TEXT PRIMARY KEY, updated_at REAL NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS linked (jira_key TEXT PRIMARY KEY, updated_at REAL NOT NULL, '
+                            'unresolved TEXT)')
+            if 'unresolved' not in {row[1] for row in self.db.execute('PRAGMA table_info(linked)')}:
+                self.db.execute('ALTER TABLE linked ADD COLUMN unresolved TEXT')
+            self.db.execute('CREATE TABLE IF NOT EXISTS follow_ups (jira_key TEXT PRIMARY KEY, comments TEXT NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS synced (jira_key TEXT PRIMARY KEY, synced_until TEXT NOT NULL)')
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM issues').fetchone()[0]
+
+    def state(self, jira_key):
+        row = self.db.execute('SELECT state FROM issues WHERE jira_key = ?', (jira_key,)).fetchone()
+        return row[0] if row else None
+
+    def submitted(self):
+        """Returns the (jira key, submission time) pairs of uploads whose response was never recorded."""
+        return self.db.execute('SELECT jira_key, updated_at FROM issues WHERE state = ? ORDER BY updated_at',
+                               (ImportCheckpoint.SUBMITTED,)).fetchall()
+
+    def status_urls(self):
+        """Returns the import status urls of all uploads GitHub has acknowledged."""
+        return {row[0] for row in self.db.execute('SELECT status_url FROM issues WHERE status_url IS NOT NULL')}
+
+    def pending(self):
+        """Returns the (jira key, status url) pairs of imports whose outcome is not known yet."""
+        return self.db.execute('SELECT jira_key, status_url FROM issues WHERE state = ? ORDER BY updated_at',
+                               (ImportCheckpoint.PENDING,)).fetchall()
+
+    def imported(self):
+        """Returns a {jira key: github issue id} dict of all imported issues."""
+        return dict(self.db.execute('SELECT jira_key, github_id FROM issues WHERE state = ?',
+                                    (ImportCheckpoint.IMPORTED,)))
+
+    def mark_submitted(self, jira_key):
+        self._set(jira_key, ImportCheckpoint.SUBMITTED)
+
+    def mark_pending(self, jira_key, status_url):
+        self._set(jira_key, ImportCheckpoint.PENDING, status_url=status_url)
+
+    def mark_imported(self, jira_key, github_id):
+        self._set(jira_key, ImportCheckpoint.IMPORTED, github_id=github_id)
+
+    def mark_failed(self, jira_key, error):
+        self._set(jira_key, ImportCheckpoint.FAILED, error=error)
+
+    def _set(self, jira_key, state, status_url=None, github_id=None, error=None):
+        # the status url is kept once known, it tells which import belongs to which issue
+        with self._lock, self.db:
+            self.db.execute('INSERT INTO issues (jira_key, state, status_url, github_id, error, updated_at) '
+                            'VALUES (?, ?, ?, ?, ?, ?) '
+                            'ON CONFLICT (jira_key) DO UPDATE SET state = excluded.state, '
+                            'status_url = COALESCE(excluded.status_url, status_url), github_id = excluded.github_id, '
+                            'error = excluded.error, updated_at = excluded.updated_at',
+                            (jira_key, state, status_url, github_id, error, time.time()))
+
+    def follow_ups(self):
+        """Returns a {jira key: comment payloads} dict of the comments still to add after the import."""
+        return {row[0]: json.loads(row[1]) for row in self.db.execute('SELECT jira_key, comments FROM follow_ups')}
+
+    def set_follow_ups(self, jira_key, comments):
+        """Stores the comments still to add to an issue, none removes its entry."""
+        with self._lock, self.db:
+            if comments:
+                self.db.execute('INSERT OR REPLACE INTO follow_ups (jira_key, comments) VALUES (?, ?)',
+                                (jira_key, json.dumps(comments)))
+            else:
+                self.db.execute('DELETE FROM follow_ups WHERE jira_key = ?', (jira_key,))
+
+    def synced(self):
+        """Returns a {jira key: ISO time} dict, the Jira comments of an issue created up to that time are on GitHub."""
+        return dict(self.db.execute('SELECT jira_key, synced_until FROM synced'))
+
+    def mark_synced(self, jira_key, synced_until):
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO synced (jira_key, synced_until) VALUES (?, ?)',
+                            (jira_key, synced_until))
+
+    def linked(self):
+        """
+        Returns a {jira key: referenced keys left unlinked} dict of the imported issues whose
+        references were linked; the keys left are the ones that were not imported then.
+        """
+        return {row[0]: set(row[1].split()) if row[1] else set()
+                for row in self.db.execute('SELECT jira_key, unresolved FROM linked')}
+
+    def mark_linked(self, jira_key, unresolved=()):
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO linked (jira_key, updated_at, unresolved) VALUES (?, ?, ?)',
+                            (jira_key, time.time(), ' '.join(sorted(unresolved)) or None))
+
+    def commented(self):
+        """Returns the Jira keys that already got their back-link comment."""
+        return {row[0] for row in self.db.execute('SELECT jira_key FROM jira_comments')}
+
+    def mark_commented(self, jira_key):
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO jira_comments (jira_key, updated_at) VALUES (?, ?)',
+                            (jira_key, time.time()))
+
+    def get_meta(self, name, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, name, value):
+        with self._lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (name, value))
+
+    def close(self):
+        self.db.close()
@@ -1,47 +1,105 @@
 #!/usr/bin/env python3
 
 import os
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # noinspection PyUnresolvedReferences
-from lxml import etree, objectify
+from lxml import objectify
 
 import requests
+from requests.adapters import HTTPAdapter
 from math import ceil
 
+from utils import XML_SUFFIXES, open_xml_file
+
 jira_server = os.getenv('JIRA_MIGRATION_JIRA_URL', 'https://issues.jenkins.io')
 jql_query = os.getenv('JIRA_MIGRATION_JQL_QUERY')
+concurrency = int(os.getenv('JIRA_MIGRATION_FETCH_CONCURRENCY', 4))
 file_path = 'jira_output'
+# none, gzip or zstd (needs the zstandard package)
+compression = os.getenv('JIRA_MIGRATION_FETCH_COMPRESSION', 'gzip')
+if compression not in XML_SUFFIXES:
+    raise RuntimeError(f'Unknown JIRA_MIGRATION_FETCH_COMPRESSION {compression}, expected one of {", ".join(XML_SUFFIXES)}')
+if compression == 'zstd':
+    # checked before anything is fetched, instead of failing every page
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        raise RuntimeError('JIRA_MIGRATION_FETCH_COMPRESSION=zstd needs the zstandard package: pip install zstandard')
 
 encoded_query = urllib.parse.quote(jql_query)
-pager = 0
+page_size = 1000
+max_retries = 3
+time_out = 300.0
+
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_maxsize=concurrency))
+session.mount('https://', HTTPAdapter(pool_maxsize=concurrency))
+
+
+def search_url(start, max_results):
+    return f'{jira_server}/sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml?jqlQuery={encoded_query}&tempMax={max_results}&pager/start={start}'
 
 
 def fetch_total_results():
     """
     Load one result from query to see how many results there will be to calculate pagination.
     """
-    global max_results, url, response, total_results
-    max_results = 1
-    url = f'{jira_server}/sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml?jqlQuery={encoded_query}&tempMax={max_results}&pager/start={max_results}'
-    response = requests.get(url)
-    result = objectify.fromstring(response.text)
+    response = session.get(search_url(1, 1), timeout=time_out)
+    result = objectify.fromstring(response.content)
     return int(result.channel.issue.attrib['total'])
 
 
-total_results = fetch_total_results()
-total_pages = ceil(total_results / 1000)
+def fetch_page(pager):
+    """
+    Streams one page of results to disk, compressed while it is written. The body goes
+    to a .part file first, which is only renamed once it is complete, so an interrupted
+    export can be resumed, also with another compression.
+    """
+    # a page only gets its final name once it is complete
+    if any(os.path.exists(f'{file_path}/result-{pager}{suffix}') for suffix in XML_SUFFIXES.values()):
+        return False
 
-max_results = 1000
+    file_name = f'{file_path}/result-{pager}{XML_SUFFIXES[compression]}'
+    part_name = file_name + '.part'
+    for attempt in range(1, max_retries + 1):
+        try:
+            with session.get(search_url(pager, page_size), stream=True, timeout=time_out) as response:
+                response.raise_for_status()
+                tail = b''
+                with open_xml_file(part_name, 'wb', compression) as doc:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        doc.write(chunk)
+                        tail = (tail + chunk)[-1024:]
+            if b'</rss>' not in tail:
+                raise RuntimeError('truncated response')
+            os.replace(part_name, file_name)
+            return True
+        except (requests.RequestException, RuntimeError) as ex:
+            print(f'Page starting at {pager} failed (attempt {attempt} of {max_retries}): {ex}')
+            if attempt < max_retries:
+                time.sleep(2 ** attempt)
+    raise RuntimeError(f'Could not fetch page starting at {pager}')
 
-while pager < total_results:
-    page_number = ceil(pager / 1000 + 1)
-    print(f'Fetching page {page_number}, out of {total_pages}')
-    url = f'{jira_server}/sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml?jqlQuery={encoded_query}&tempMax={max_results}&pager/start={pager}'
-    response = requests.get(url)
-    root = objectify.fromstring(response.text)
 
-    with open(f'{file_path}/result-{pager}.xml', 'wb') as doc:
-        doc.write(etree.tostring(root, pretty_print=True))
-    pager += 1000
+total_results = fetch_total_results()
+total_pages = ceil(total_results / page_size)
+os.makedirs(file_path, exist_ok=True)
+
+failed = 0
+with ThreadPoolExecutor(max_workers=concurrency) as pool:
+    futures = {pool.submit(fetch_page, pager): pager for pager in range(0, total_results, page_size)}
+    for done, future in enumerate(as_completed(futures), 1):
+        page_number = futures[future] // page_size + 1
+        try:
+            fetched = future.result()
+            print(f'Page {page_number} {"fetched" if fetched else "already complete"}, {done} out of {total_pages}')
+        except RuntimeError as ex:
+            failed += 1
+            print(ex)
 
-print('Complete')
+if failed:
+    print(f'{failed} pages failed, run again to fetch the missing ones')
+else:
+    print('Complete')
@@ -1,20 +1,24 @@
 #!/usr/bin/env python3
 import os
 
+from parse_cache import ParseCache
 from project import Project
-from utils import read_xml_files
 
-jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME')
-jira_done_id = os.getenv('JIRA_MIGRATION_JIRA_DONE_ID')
-jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL')
-file_names = os.getenv('JIRA_MIGRATION_FILE_PATHS')
 
-project = Project(jira_proj, jira_done_id, jira_base_url)
+def main():
+    # parse workers re-import this module when they are spawned, so nothing may run on import
+    jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME')
+    jira_done_id = os.getenv('JIRA_MIGRATION_JIRA_DONE_ID')
+    jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL')
+    file_names = os.getenv('JIRA_MIGRATION_FILE_PATHS')
 
-all_xml_files = read_xml_files(file_names)
+    project = Project(jira_proj, jira_done_id, jira_base_url)
 
-for f in all_xml_files:
-    for item in f.channel.item:
-        project.add_item(item)
+    project.add_files(file_names, processes=int(os.getenv('JIRA_MIGRATION_PARSE_PROCESSES', os.cpu_count())),
+                      cache=ParseCache.from_env())
 
-[print(key) for key in sorted(project.get_labels().keys())]
+    [print(key) for key in sorted(project.get_labels().keys())]
+
+
+if __name__ == '__main__':
+    main()
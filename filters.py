@@ -0,0 +1,138 @@
+import os
+import re
+from datetime import datetime, timezone
+
+from utils import convert_to_iso, to_utc
+
+_KEY_RANGE = re.compile(r'^([A-Za-z][A-Za-z0-9_]*)-(\d+)\.\.(?:([A-Za-z][A-Za-z0-9_]*)-)?(\d+)$')
+
+
+def _split(value):
+    return value.replace(',', ' ').split()
+
+
+def read_keys(file_name):
+    """Reads Jira keys from a file, separated by white space or commas, lines starting with '#' are ignored."""
+    with open(file_name) as file:
+        return [key for line in file if not line.startswith('#') for key in _split(line)]
+
+
+def parse_key_range(value):
+    """Parses 'INFRA-100..INFRA-200' (or 'INFRA-100..200') into ('INFRA', 100, 200)."""
+    m = _KEY_RANGE.match(value.strip())
+    if not m or (m[3] and m[3] != m[1]):
+        raise RuntimeError('Invalid Jira key range: %s, expected e.g. INFRA-100..INFRA-200' % value)
+    return m[1], int(m[2]), int(m[4])
+
+
+def _parse_since(value):
+    since = datetime.fromisoformat(value)
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+
+class IssueFilter:
+    """
+    Picklable predicate on the raw <item> elements of a Jira export, checked
+    while streaming, before an item is turned into an issue.
+    An item is accepted when its key is in keys, in one of the key ranges or
+    matches key_pattern (when any of these is given), it is not in skip_keys and
+    doesn't match skip_pattern, and its project, status, type and updated time
+    match the given ones. Statuses and types are compared case-insensitively.
+    """
+
+    def __init__(self, keys=(), skip_keys=(), key_ranges=(), key_pattern=None, skip_pattern=None,
+                 projects=(), statuses=(), types=(), updated_since=None):
+        self.keys = frozenset(keys)
+        self.skip_keys = frozenset(skip_keys)
+        self.key_ranges = tuple(parse_key_range(r) if isinstance(r, str) else r for r in key_ranges)
+        self.key_pattern = re.compile(key_pattern) if key_pattern else None
+        self.skip_pattern = re.compile(skip_pattern) if skip_pattern else None
+        self.projects = frozenset(projects)
+        self.statuses = frozenset(status.lower() for status in statuses)
+        self.types = frozenset(issue_type.lower() for issue_type in types)
+        self.updated_since = _parse_since(updated_since) if isinstance(updated_since, str) else updated_since
+        self._selects_keys = bool(self.keys or self.key_ranges or self.key_pattern)
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the filter from JIRA_TICKETS, JIRA_TICKETS_SKIP (keys separated by commas or spaces),
+        JIRA_TICKETS_FILE, JIRA_TICKETS_SKIP_FILE (files of keys) and the JIRA_MIGRATION_FILTER_*
+        variables: RANGES, KEY_PATTERN, SKIP_PATTERN, PROJECTS, STATUSES, TYPES and UPDATED_SINCE.
+        """
+        keys = _split(os.getenv('JIRA_TICKETS', ''))
+        if os.getenv('JIRA_TICKETS_FILE'):
+            keys += read_keys(os.getenv('JIRA_TICKETS_FILE'))
+        skip_keys = _split(os.getenv('JIRA_TICKETS_SKIP', ''))
+        if os.getenv('JIRA_TICKETS_SKIP_FILE'):
+            skip_keys += read_keys(os.getenv('JIRA_TICKETS_SKIP_FILE'))
+        statuses = os.getenv('JIRA_MIGRATION_FILTER_STATUSES', '')
+        types = os.getenv('JIRA_MIGRATION_FILTER_TYPES', '')
+        issue_filter = cls(keys=keys,
+                           skip_keys=skip_keys,
+                           key_ranges=_split(os.getenv('JIRA_MIGRATION_FILTER_RANGES', '')),
+                           key_pattern=os.getenv('JIRA_MIGRATION_FILTER_KEY_PATTERN'),
+                           skip_pattern=os.getenv('JIRA_MIGRATION_FILTER_SKIP_PATTERN'),
+                           projects=_split(os.getenv('JIRA_MIGRATION_FILTER_PROJECTS', '')),
+                           # names may contain spaces, e.g. "In Progress"
+                           statuses=[s.strip() for s in statuses.split(',') if s.strip()],
+                           types=[t.strip() for t in types.split(',') if t.strip()],
+                           updated_since=os.getenv('JIRA_MIGRATION_FILTER_UPDATED_SINCE') or None)
+        if issue_filter:
+            print('Issue filter:', issue_filter.describe())
+        return issue_filter
+
+    def __bool__(self):
+        return bool(self._selects_keys or self.skip_keys or self.skip_pattern or self.projects
+                    or self.statuses or self.types or self.updated_since)
+
+    def describe(self):
+        parts = []
+        if self.keys:
+            parts.append('%d keys' % len(self.keys))
+        if self.key_ranges:
+            parts.append('ranges ' + ', '.join('%s-%d..%d' % r for r in self.key_ranges))
+        if self.key_pattern:
+            parts.append('keys matching ' + self.key_pattern.pattern)
+        if self.skip_keys:
+            parts.append('skipping %d keys' % len(self.skip_keys))
+        if self.skip_pattern:
+            parts.append('skipping keys matching ' + self.skip_pattern.pattern)
+        for name, values in (('projects', self.projects), ('statuses', self.statuses), ('types', self.types)):
+            if values:
+                parts.append('%s %s' % (name, ', '.join(sorted(values))))
+        if self.updated_since:
+            parts.append('updated since ' + self.updated_since.isoformat())
+        return '; '.join(parts)
+
+    def accepts_key(self, key):
+        if key in self.skip_keys or (self.skip_pattern and self.skip_pattern.fullmatch(key)):
+            return False
+        if not self._selects_keys or key in self.keys:
+            return True
+        if self.key_ranges:
+            project, _, number = key.rpartition('-')
+            if number.isdigit():
+                number = int(number)
+                for range_project, first, last in self.key_ranges:
+                    if project == range_project and first <= number <= last:
+                        return True
+        return bool(self.key_pattern and self.key_pattern.fullmatch(key))
+
+    def __call__(self, item):
+        if not self.accepts_key(item.findtext('key')):
+            return False
+        if self.projects:
+            project = item.find('project')
+            key = project.get('key') if project is not None else item.findtext('key').split('-')[0]
+            if key not in self.projects:
+                return False
+        if self.statuses and (item.findtext('status') or '').lower() not in self.statuses:
+            return False
+        if self.types and (item.findtext('type') or '').lower() not in self.types:
+            return False
+        if self.updated_since:
+            updated = item.findtext('updated')
+            if not updated or to_utc(convert_to_iso(updated)) < self.updated_since:
+                return False
+        return True
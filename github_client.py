@@ -0,0 +1,132 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+
+class GitHubClient:
+    """
+    Thin wrapper around a pooled requests.Session shared by all GitHub calls.
+    It keeps track of the rate limit budget reported in the response headers,
+    spreads the remaining calls over the reset window when the budget runs low,
+    and retries rate limited (primary and secondary) responses with jittered backoff.
+    Server errors are only retried for idempotent methods, as a retried POST
+    could create an issue, comment or label twice.
+    Every call and backoff is counted in metrics.
+    """
+    _DEFAULT_TIME_OUT = 120.0
+    _MAX_RETRIES = 6
+    _MAX_BACKOFF = 300.0
+    # below this many remaining calls, requests are paced until the window resets
+    _LOW_BUDGET = 100
+    _RETRY_STATUS_CODES = (500, 502, 503, 504)
+    _IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'PATCH', 'DELETE')
+
+    def __init__(self, token, pool_size=20):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/vnd.github.golden-comet-preview+json',
+            'Authorization': f'token {token}'
+        })
+
+        self._lock = threading.Lock()
+        self.remaining = None
+        self.reset_at = 0.0
+        self._blocked_until = 0.0
+        self._next_slot = 0.0
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', GitHubClient._DEFAULT_TIME_OUT)
+        attempt = 0
+        while True:
+            self._wait_for_budget()
+            with metrics.stage('http'):
+                response = self.session.request(method, url, **kwargs)
+            metrics.count_http(method, url, response.status_code)
+            self._update_budget(response)
+
+            delay = self._retry_delay(method, response, attempt)
+            if delay is None or attempt >= GitHubClient._MAX_RETRIES:
+                return response
+
+            attempt += 1
+            metrics.count_retry(delay)
+            if response.status_code in GitHubClient._RETRY_STATUS_CODES:
+                # a server error only holds back this call
+                print('Server error (%d) on %s %s, retrying in %.1fs' % (response.status_code, method, url, delay))
+                time.sleep(delay)
+                continue
+            print('Rate limited (%d) on %s %s, retrying in %.1fs' % (response.status_code, method, url, delay))
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.time() + delay)
+
+    def _wait_for_budget(self):
+        with self._lock:
+            now = time.time()
+            pause = self._blocked_until - now
+            if self.remaining is not None and self.reset_at > now:
+                if self.remaining <= 0:
+                    pause = max(pause, self.reset_at - now + 1)
+                elif self.remaining < GitHubClient._LOW_BUDGET:
+                    # hand out evenly spaced slots, shared by all threads
+                    slot = max(self._next_slot, now)
+                    self._next_slot = slot + (self.reset_at - now) / self.remaining
+                    pause = max(pause, slot - now)
+                    self.remaining -= 1
+        if pause > 0:
+            time.sleep(pause)
+
+    def _update_budget(self, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            self.reset_at = float(reset)
+
+    def _retry_delay(self, method, response, attempt):
+        """
+        Returns the number of seconds to wait before retrying, or None when the
+        response should be returned to the caller as it is.
+        """
+        status = response.status_code
+        if status in GitHubClient._RETRY_STATUS_CODES:
+            if method.upper() not in GitHubClient._IDEMPOTENT_METHODS:
+                return None
+        elif status not in (403, 429):
+            return None
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+
+        if status in (403, 429):
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                return max(float(response.headers.get('X-RateLimit-Reset', 0)) - time.time(), 0) + 1
+            text = response.text.lower()
+            if status == 403 and 'rate limit' not in text and 'abuse' not in text:
+                # a plain permission error, retrying won't help
+                return None
+
+        # secondary rate limit or transient server error: exponential backoff with jitter
+        return min(2 ** attempt * (1 + random.random()), GitHubClient._MAX_BACKOFF)
@@ -1,33 +1,57 @@
 import os
-import requests
+import re
 import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, ALL_COMPLETED
 
-from utils import fetch_labels_mapping, fetch_allowed_labels, convert_label, get_github_search_url
-
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from checkpoint import ImportCheckpoint
+from github_client import GitHubClient
+from metrics import metrics
+from payload_guard import PayloadGuard
+from records import Comment, CompiledIssue
+from status_poller import ImportStatusPoller, StatusCheckError
+from label_resolver import LabelResolver
+from utils import get_github_search_url, to_utc
+
+# maximum number of issue imports in flight (submitted, status not yet known)
 batch_size = int(os.getenv('JIRA_MIGRATION_BATCH_SIZE', 20))
+# check the status of many imports with one request to the import list endpoint
+use_import_list = os.getenv('JIRA_MIGRATION_STATUS_LIST', 'false') == 'true'
+# e.g. a GitHub Enterprise server or the fake server of benchmarks/fake_github.py
+github_api_url = os.getenv('JIRA_MIGRATION_GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+
+def _never_sent(ex):
+    """Whether a request failed while connecting, so nothing reached the server."""
+    if isinstance(ex, requests.ConnectTimeout):
+        return True
+    # refused connections and failed name lookups, urllib3's NewConnectionError is a ConnectTimeoutError
+    reason = getattr(ex.args[0], 'reason', None) if ex.args else None
+    return isinstance(ex, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
 
 class Importer:
-    _GITHUB_ISSUE_PREFIX = "INFRA-"
-    _PLACEHOLDER_PREFIX = "@PSTART"
-    _PLACEHOLDER_SUFFIX = "@PEND"
-    _DEFAULT_TIME_OUT = 120.0
+    _EPIC_CHILDREN = '\nEpic children:\n\n'
+    _EPIC_CHILD = re.compile(r'^- #(\d+)$', re.MULTILINE)
+    # GitHub search links for a Jira key, as made by utils.get_github_search_url
+    _SEARCH_LINK = re.compile(r'\.\./issues\?q=in%3A(?:title|comment)\+%22([A-Za-z][A-Za-z0-9_]*-\d+)%22')
 
-    def __init__(self, options, project):
+    def __init__(self, options, project, checkpoint):
         self.options = options
         self.project = project
-        self.github_url = 'https://api.github.com/repos/%s/%s' % (
-            self.options.account, self.options.repo)
-        self.jira_issue_replace_patterns = {
-            'https://issues.jenkins.io/browse/%s%s' % (self.project.name, r'-(\d+)'): r'\1',
-            self.project.name + r'-(\d+)': Importer._GITHUB_ISSUE_PREFIX + r'\1',
-            r'Issue (\d+)': Importer._GITHUB_ISSUE_PREFIX + r'\1'}
-        self.headers = {
-            'Accept': 'application/vnd.github.golden-comet-preview+json',
-            'Authorization': f'token {options.accesstoken}'
-        }
-
-        self.labels_mapping = fetch_labels_mapping()
-        self.approved_labels = fetch_allowed_labels()
+        self.checkpoint = checkpoint
+        self.github_url = '%s/repos/%s/%s' % (
+            github_api_url, self.options.account, self.options.repo)
+        self.client = GitHubClient(options.accesstoken, pool_size=batch_size + 4)
+        # Jira keys of the issues given new comments in this run, their references are linked again
+        self.commented_keys = set()
+        self.payload_guard = PayloadGuard(int(os.getenv('JIRA_MIGRATION_MAX_PAYLOAD_BYTES', 900000)),
+                                          int(os.getenv('JIRA_MIGRATION_MAX_COMMENTS', 200)))
+
+        self.label_resolver = LabelResolver.from_files()
 
     def import_milestones(self):
         """
@@ -35,102 +59,88 @@ class Importer:
         """
         milestone_url = self.github_url + '/milestones'
         print('Importing milestones...', milestone_url)
-        print
-
-        # Check existing first
-        existing = list()
-
-        def get_milestone_list(url):
-            return requests.get(url, headers=self.headers,
-                                timeout=Importer._DEFAULT_TIME_OUT)
-
-        def get_next_page_url(url):
-            return url.replace('<', '').replace('>', '').replace('; rel="next"', '')
-
-        milestone_pages = list()
-        ms = get_milestone_list(milestone_url + '?state=all')
-        milestone_pages.append(ms.json())
-
-        if 'Link' in ms.headers:
-            links = ms.headers['Link'].split(',')
-            nextPageUrl = get_next_page_url(links[0])
-
-            while nextPageUrl is not None:
-                time.sleep(1)
-                nextPageUrl = None
-
-                for l in links:
-                    if 'rel="next"' in l:
-                        nextPageUrl = get_next_page_url(l)
-
-                if nextPageUrl is not None:
-                    ms = get_milestone_list(nextPageUrl)
-                    links = ms.headers['Link'].split(',')
-                    milestone_pages.append(ms.json())
-
-        for ms_json in milestone_pages:
-            for m in ms_json:
-                print(self.project.get_milestones().keys())
-                try:
-                    if m['title'] in self.project.get_milestones().keys():
-                        self.project.get_milestones()[m['title']] = m['number']
-                        print(m['title'], 'found')
-                        existing.append(m['title'])
-                except TypeError:
-                    pass
-
-        # Export new ones
-        for mkey in self.project.get_milestones().keys():
-            if mkey in existing:
-                continue
-
-            data = {'title': mkey}
-            r = requests.post(milestone_url, json=data, headers=self.headers,
-                timeout=Importer._DEFAULT_TIME_OUT)
-
-            # overwrite histogram data with the actual milestone id now
-            if r.status_code == 201:
-                content = r.json()
-                self.project.get_milestones()[mkey] = content['number']
-                print(mkey)
+        print()
 
+        existing = {m['title']: m['number'] for m in self._iter_pages(milestone_url + '?state=all&per_page=100')}
+        milestones = self.project.get_milestones()
+        for title in milestones.keys() & existing.keys():
+            milestones[title] = existing[title]
+        missing = sorted(milestones.keys() - existing.keys())
+        print('%d milestones found, %d to create' % (len(milestones) - len(missing), len(missing)))
+
+        def create(title):
+            return title, self.client.post(milestone_url, json={'title': title})
+
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            for title, r in pool.map(create, missing):
+                # overwrite histogram data with the actual milestone id now
+                if r.status_code == 201:
+                    milestones[title] = r.json()['number']
+                    print(title)
+                else:
+                    print('Failure importing milestone ' + title, r.status_code, r.content)
 
     def import_labels(self, colour_selector):
         """
-        Imports the gathered project components and labels as labels into GitHub
+        Imports the gathered project components and labels as labels into GitHub,
+        only the labels missing from the repository are created
         """
         label_url = self.github_url + '/labels'
         print('Importing labels...', label_url)
         print()
 
+        # GitHub label names are case insensitive
+        existing = {label['name'].lower() for label in self._iter_pages(label_url + '?per_page=100')}
+
+        wanted = {}
         for lkey in self.project.get_all_labels().keys():
 
             prefixed_lkey = lkey.lower()
             # prefix component
-            if os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true') == 'true':
-                if lkey in self.project.get_components().keys():
-                    prefixed_lkey = 'jira-component:' + prefixed_lkey
+            if self.label_resolver.include_components and lkey in self.project.get_components():
+                prefixed_lkey = 'jira-component:' + prefixed_lkey
 
-            prefixed_lkey = convert_label(prefixed_lkey, self.labels_mapping, self.approved_labels)
+            prefixed_lkey = self.label_resolver.resolve(prefixed_lkey)
             if prefixed_lkey is None:
                 continue
+            wanted.setdefault(prefixed_lkey, lkey)
 
-            data = {'name': prefixed_lkey,
-                    'color': colour_selector.get_colour(lkey)}
-            r = requests.post(label_url, json=data, headers=self.headers, timeout=Importer._DEFAULT_TIME_OUT)
-            if r.status_code == 201:
-                print(lkey + '->' + prefixed_lkey)
-            else:
-                print('Failure importing label ' + prefixed_lkey,
-                      r.status_code, r.content, r.headers)
+        missing = sorted(name for name in wanted if name.lower() not in existing)
+        print('%d labels found, %d to create' % (len(wanted) - len(missing), len(missing)))
+
+        def create(name):
+            data = {'name': name,
+                    'color': colour_selector.get_colour(wanted[name])}
+            return name, self.client.post(label_url, json=data)
+
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            for name, r in pool.map(create, missing):
+                if r.status_code == 201:
+                    print(wanted[name] + '->' + name)
+                else:
+                    print('Failure importing label ' + name, r.status_code, r.content)
 
-    def import_issues(self, start_from_count):
+    def _iter_pages(self, url):
         """
-        Starts the issue import into GitHub:
+        Yields the items of a paginated GitHub list endpoint, following the Link headers.
+        """
+        while url:
+            response = self.client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    "Failed to list {} due to unexpected HTTP status code: {}".format(url, response.status_code)
+                )
+            yield from response.json()
+            url = response.links.get('next', {}).get('url')
+
+    def import_issues(self, issues=None):
+        """
+        Starts the issue import into GitHub, of all project issues by default:
+        Imports left pending by a previous run are polled again, and issues
+        the checkpoint already knows as pending or imported are skipped.
         First the milestone id is captured for the issue.
         Then JIRA issue relationships are converted into comments.
-        After that, the comments are taken out of the issue and
-        references to JIRA issues in comments are replaced with a placeholder
+        References to JIRA issues stay GitHub search links until post_process_comments.
         """
         print('Importing issues...')
 
@@ -139,67 +149,243 @@ class Importer:
 
         count = 0
 
-        self.tickets_pending_url = []
-
-        for issue in self.project.get_issues():
-            if start_from_count > count:
+        self.tickets_pending = {}
+
+        self.status_poller = ImportStatusPoller(self.client, self.github_url + '/import/issues',
+                                                workers=min(batch_size, 8), use_list=use_import_list)
+        # the comments that did not fit in the payloads are added from here, so uploads go on meanwhile
+        self.follow_up_pool = ThreadPoolExecutor(max_workers=4)
+
+        unsettled = self.recover_submitted()
+        follow_ups = self.checkpoint.follow_ups()
+        for jira_key, status_url in self.checkpoint.pending():
+            print('Resuming status check of', jira_key)
+            future = self.status_poller.submit(status_url, 0)
+            self.tickets_pending[future] = (None, jira_key, follow_ups.get(jira_key, []))
+        github_ids = self.checkpoint.imported()
+        for jira_key, comments in follow_ups.items():
+            if jira_key in github_ids:
+                print('Resuming the comments of', jira_key)
+                self.submit_follow_up_comments(github_ids[jira_key], jira_key, comments)
+
+        for issue in self.project.get_issues() if issues is None else issues:
+            state = self.checkpoint.state(issue.key)
+            if state in (ImportCheckpoint.PENDING, ImportCheckpoint.IMPORTED):
                 count += 1
                 continue
+            if state == ImportCheckpoint.SUBMITTED:
+                if issue.key in unsettled:
+                    print('Skipping %s, its upload may have reached GitHub' % issue.key)
+                    count += 1
+                    continue
+                print('Warning: the upload of %s did not reach GitHub, it is submitted again' % issue.key)
 
             print("\nIndex = ", count)
 
-            if 'milestone_name' in issue:
-                if issue['milestone_name']:
-                    issue['milestone'] = self.project.get_milestones()[issue['milestone_name']]
-                del issue['milestone_name']
+            self.import_issue_with_comments(issue, self.build_payload(issue))
+            count += 1
+
+            # keep at most batch_size imports in flight, record whichever finishes first
+            if len(self.tickets_pending) >= batch_size:
+                self.batch_wait(FIRST_COMPLETED)
 
-            # turn epic into label
-            epic_link = issue.get('epic')
-            if epic_link:
-                epic_link = self.project.epic_mapping.get(epic_link, epic_link)
-                self.project._project['Labels'][epic_link] += 1
-                issue['labels'].append(epic_link)
-            issue.pop('epic', None)
+        self.batch_wait()
+        self.status_poller.close()
+        self.follow_up_pool.shutdown()
 
-            self.convert_relationships_to_comments(issue)
+    def recover_submitted(self):
+        """
+        Finds the imports of uploads whose response was lost, so they are polled instead
+        of being uploaded twice, and returns the Jira keys that could not be settled.
+        Uploads are made one after the other, so when there are as many imports that
+        no issue in the checkpoint claims as such uploads, they are theirs, in order.
+        Without any such import, the uploads never reached GitHub and are submitted again.
+        Otherwise there is no telling which upload made which import, so the issues
+        are left submitted and skipped, to be checked on GitHub by hand.
+        """
+        submitted = self.checkpoint.submitted()
+        if not submitted:
+            return set()
+        known = self.checkpoint.status_urls()
+        # a minute of margin for the clock skew with GitHub, older imports are claimed anyway
+        since = datetime.fromtimestamp(submitted[0][1] - 60, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        imports = sorted((item for item in self._iter_pages(self.github_url + '/import/issues?per_page=100&since=' + since)
+                          if item['url'] not in known), key=lambda item: item['id'])
+        if not imports:
+            return set()
+        if len(imports) != len(submitted):
+            print('Warning: %d unknown imports for %d uploads without response, they are not matched:'
+                  % (len(imports), len(submitted)))
+            print('  uploads:', ', '.join(jira_key for jira_key, _ in submitted))
+            print('  imports:', ', '.join(item['url'] for item in imports))
+            print('Check these imports on GitHub, the issues stay submitted and are skipped until then')
+            return {jira_key for jira_key, _ in submitted}
+        for (jira_key, _), item in zip(submitted, imports):
+            print('Found the import of interrupted upload', jira_key)
+            self.checkpoint.mark_pending(jira_key, item['url'])
+        return set()
+
+    def build_payload(self, issue):
+        """
+        Returns the Issue Import API payload of an issue record, or of a CompiledIssue,
+        with the milestone name resolved to the GitHub milestone id.
+        """
+        payload = issue.payload if isinstance(issue, CompiledIssue) else self.compile_payload(issue)
+        milestone = self.project.get_milestones()[issue.milestone_name] if issue.milestone_name else None
+        if milestone:
+            payload['issue']['milestone'] = milestone
+        return payload
 
-            issue_comments = issue['comments']
-            del issue['comments']
-            comments = []
-            for comment in issue_comments:
-                comments.append(
-                    dict((k, self._replace_jira_with_github_id(v)) for k, v in comment.items()))
+    def compile_payload(self, issue):
+        """
+        Turns an issue record into its Issue Import API payload, without the milestone:
+        the epic becomes a label and the relationships become comments.
+        """
+        labels = list(issue.labels)
+        # turn epic into label
+        if issue.epic:
+            epic_link = self.project.epic_mapping.get(issue.epic, issue.epic)
+            self.project._project['Labels'][epic_link] += 1
+            epic_label = self.label_resolver.resolve_issue_label(epic_link)
+            if epic_label:
+                labels.append(epic_label)
 
-            # remove dup
-            issue['labels'] = list(set(issue['labels']))
+        comments = issue.comments + self.convert_relationships_to_comments(issue)
 
-            self.import_issue_with_comments(issue, comments)
-            count += 1
+        return issue.to_payload(labels=labels, comments=comments)
 
-            if len(self.tickets_pending_url) % batch_size == 0:
-                self.batch_wait()
+    def compile_payloads(self, shards):
+        """
+        Dry run: writes the payloads of all project issues to shards, a PayloadShards,
+        so they can be checked and uploaded later, as often as needed, without parsing again.
+        """
+        print('Compiling %d issues to %s...' % (len(self.project.get_issues()), shards.directory))
+        shards.clear()
+        for issue in self.project.get_issues():
+            shards.append(CompiledIssue(issue.key, issue.epic, issue.updated_at, issue.milestone_name,
+                                        self.compile_payload(issue)))
+        # after the payloads, which count the epic labels
+        shards.save_manifest(self.project)
+        print('Compiled %d issues' % len(shards))
 
-        self.batch_wait()
+    def sync_issues(self):
+        """
+        Delta sync for a project that was already migrated while Jira is still in use:
+        only issues updated in Jira after the saved high-water mark are processed.
+        Issues not on GitHub yet are imported, issues already imported get the
+        Jira comments created since the last sync added as new comments.
+        Issues not on GitHub are imported whatever their update time, e.g. ones that failed before.
+        Without a high-water mark, only the missing issues are imported.
+        The comments added are recorded per issue in the checkpoint, so a sync that
+        stops halfway is simply run again, and issues whose comments could not all
+        be added keep the high-water mark before them, to be synced again.
+        """
+        since = self.checkpoint.get_meta('high_water_mark')
+        since_dt = to_utc(since) if since else None
+        print('Syncing issues updated since', since or 'the beginning')
+
+        github_ids = self.checkpoint.imported()
+        synced = self.checkpoint.synced()
+        new_issues = []
+        unsynced = []
+        for issue in self.project.get_issues():
+            github_id = github_ids.get(issue.key)
+            if github_id is None:
+                new_issues.append(issue)
+                continue
+            if not since_dt:
+                continue
+            # the comments of an issue synced before are on GitHub up to when they were recorded
+            issue_since = to_utc(synced[issue.key]) if issue.key in synced else since_dt
+            if to_utc(issue.updated_at) > issue_since and not self.add_new_comments(github_id, issue, issue_since):
+                unsynced.append(issue)
+
+        print('Importing %d new issues' % len(new_issues))
+        self.import_issues(new_issues)
+        self.record_high_water_mark(unsynced)
 
-    def batch_wait(self):
-        while self.tickets_pending_url:
-            issue, jira_key, status_url, ex = self.tickets_pending_url.pop(0)
+    def add_new_comments(self, github_id, issue, since_dt):
+        """
+        Adds the Jira comments created after since_dt to an already imported GitHub issue, oldest first.
+        Each one added is recorded in the checkpoint; returns whether all of them were added.
+        """
+        comment_url = '%s/issues/%d/comments' % (self.github_url, github_id)
+        # comments made from issue fields have no timestamp, they were imported with the issue
+        comments = sorted((comment for comment in issue.comments
+                           if comment.created_at and to_utc(comment.created_at) > since_dt),
+                          key=lambda comment: to_utc(comment.created_at))
+        for comment in comments:
             try:
-                if ex:
-                    raise ex
-                gh_issue_url = self.wait_for_issue_creation(status_url, 0).json()['issue_url']
-                gh_issue_id = int(gh_issue_url.split('/')[-1])
-                issue['githubid'] = gh_issue_id
-                issue['key'] = jira_key
-            except RuntimeError as ex:
-                print(ex)
-                gh_issue_id = str(ex).replace("\n", " ")
-
-            jira_gh = f"{jira_key}:{gh_issue_id}\n"
-            with open('jira-keys-to-github-id.txt', 'a') as f:
-                f.write(jira_gh)
-
-    def import_issue_with_comments(self, issue, comments):
+                r = self.client.post(comment_url, json={'body': comment.body})
+            except requests.RequestException as ex:
+                print('Failure adding comment to ' + issue.key, ex)
+                return False
+            if r.status_code != 201:
+                print('Failure adding comment to ' + issue.key, r.status_code, r.content)
+                return False
+            self.commented_keys.add(issue.key)
+            self.checkpoint.mark_synced(issue.key, comment.created_at)
+            print('Added comment to', issue.key, '->', github_id)
+        self.checkpoint.mark_synced(issue.key, issue.updated_at)
+        return True
+
+    def record_high_water_mark(self, unsynced=()):
+        """
+        Saves the newest Jira 'updated' timestamp of the imported issues, the next delta sync starts from there.
+        Issues that failed don't count, they are imported by the next sync anyway.
+        The mark stays before the unsynced issues, whose new comments could not all be added.
+        """
+        since = self.checkpoint.get_meta('high_water_mark')
+        newest = to_utc(since) if since else None
+        github_ids = self.checkpoint.imported()
+        for issue in self.project.get_issues():
+            if issue.key not in github_ids:
+                continue
+            updated = to_utc(issue.updated_at)
+            if newest is None or updated > newest:
+                newest = updated
+        if unsynced and newest is not None:
+            # just before the oldest one, so it is still newer than the mark
+            newest = min(newest, min(to_utc(issue.updated_at) for issue in unsynced) - timedelta(microseconds=1))
+        if newest is not None:
+            self.checkpoint.set_meta('high_water_mark', newest.isoformat())
+
+    def batch_wait(self, return_when=ALL_COMPLETED):
+        """
+        Waits for pending issue imports, by default all of them, and records
+        the GitHub issue id of each one as soon as its status is known.
+        """
+        if not self.tickets_pending:
+            return
+        done, _ = wait(self.tickets_pending, return_when=return_when)
+        with open('jira-keys-to-github-id.txt', 'a') as f:
+            for future in done:
+                issue, jira_key, follow_ups = self.tickets_pending.pop(future)
+                try:
+                    gh_issue_url = future.result().json()['issue_url']
+                    gh_issue_id = int(gh_issue_url.split('/')[-1])
+                    if issue is not None:
+                        issue.github_id = gh_issue_id
+                    self.checkpoint.mark_imported(jira_key, gh_issue_id)
+                    metrics.count('issues_imported')
+                    if follow_ups:
+                        self.submit_follow_up_comments(gh_issue_id, jira_key, follow_ups)
+                except StatusCheckError as ex:
+                    # the import may well have succeeded, the checkpoint keeps it to check again
+                    print(ex)
+                    print('The outcome of %s is unknown, run again to check it' % jira_key)
+                    metrics.count('issues_unknown')
+                    continue
+                except (RuntimeError, requests.RequestException) as ex:
+                    print(ex)
+                    gh_issue_id = str(ex).replace("\n", " ")
+                    self.checkpoint.mark_failed(jira_key, gh_issue_id)
+                    metrics.count('issues_failed')
+
+                f.write(f"{jira_key}:{gh_issue_id}\n")
+        metrics.maybe_write()
+
+    def import_issue_with_comments(self, issue, issue_data):
         """
         Imports a single issue with its comments into GitHub.
         Importing via GitHub's normal Issue API quickly triggers anti-abuse rate limits.
@@ -207,31 +393,72 @@ class Importer:
         https://gist.github.com/jonmagic/5282384165e0f86ef105
         This is a two-step process:
         First the issue with the comments is pushed to GitHub asynchronously.
-        Then GitHub is pulled in a loop until the issue import is completed.
-        Finally the issue github is noted.
+        Then the ImportStatusPoller polls GitHub in the background until the issue import is completed.
+        Uploads happen in order, so issue numbering is kept, while up to
+        batch_size imports are in flight.
         """
-        print('Issue   ', issue['key'])
-        print('Labels  ', issue['labels'])
-        print('Assignee', issue['assignee'])
-        jira_key = issue['key']
-        del issue['key']
-        if not issue['assignee']:
-            del issue['assignee']
-
+        print('Issue   ', issue.key)
+        print('Labels  ', issue_data['issue']['labels'])
+        print('Assignee', issue_data['issue'].get('assignee'))
+        jira_key = issue.key
+        issue_data, follow_ups = self.payload_guard.fit(issue_data)
+
+        # stored before the upload, so they are added even if this run stops before the import finishes
+        self.checkpoint.set_follow_ups(jira_key, follow_ups)
+        self.checkpoint.mark_submitted(jira_key)
         try:
-            response = self.upload_github_issue(issue, comments)
-            self.tickets_pending_url.append((issue, jira_key, response.json()['url'], None))
+            response = self.upload_github_issue(issue_data)
+            status_url = response.json()['url']
+            self.checkpoint.mark_pending(jira_key, status_url)
+            future = self.status_poller.submit(status_url)
         except RuntimeError as ex:
-            self.tickets_pending_url.append((issue, jira_key, None, ex))
+            future = Future()
+            future.set_exception(ex)
+        except requests.RequestException as ex:
+            future = Future()
+            if _never_sent(ex):
+                # recorded right away, recover_submitted must only see uploads that may have reached GitHub
+                self.checkpoint.mark_failed(jira_key, str(ex))
+                future.set_exception(RuntimeError('The upload of %s did not reach GitHub: %s' % (jira_key, ex)))
+            else:
+                # the upload may have reached GitHub, it stays submitted for recover_submitted
+                future.set_exception(StatusCheckError('No response to the upload of %s: %s' % (jira_key, ex)))
+        self.tickets_pending[future] = (issue, jira_key, follow_ups)
 
-    def upload_github_issue(self, issue, comments):
+    def submit_follow_up_comments(self, github_id, jira_key, comments):
+        """Adds the comments that did not fit in the import payload in the background, see add_follow_up_comments."""
+        # their Jira references are linked by post_process_comments, also for an issue linked before
+        self.commented_keys.add(jira_key)
+        self.follow_up_pool.submit(self.add_follow_up_comments, github_id, jira_key, comments)
+
+    def add_follow_up_comments(self, github_id, jira_key, comments):
+        """
+        Adds the comments that did not fit in the import payload to the imported issue, in order.
+        The checkpoint keeps the ones not added yet, a failure leaves them for the next run.
+        """
+        comment_url = '%s/issues/%d/comments' % (self.github_url, github_id)
+        for index, comment in enumerate(comments):
+            try:
+                r = self.client.post(comment_url, json={'body': PayloadGuard.follow_up_body(comment)})
+            except requests.RequestException as ex:
+                print('Failure adding comment to ' + jira_key, ex)
+                print('%d comments of %s are added on the next run' % (len(comments) - index, jira_key))
+                return
+            if r.status_code != 201:
+                print('Failure adding comment to ' + jira_key, r.status_code, r.content)
+                print('%d comments of %s are added on the next run' % (len(comments) - index, jira_key))
+                return
+            self.checkpoint.set_follow_ups(jira_key, comments[index + 1:])
+        print('Added %d comments to %s -> %d' % (len(comments), jira_key, github_id))
+
+    def upload_github_issue(self, issue_data):
         """
         Uploads a single issue to GitHub asynchronously with the Issue Import API.
         """
+        issue = issue_data['issue']
         issue_url = self.github_url + '/import/issues'
-        issue_data = {'issue': issue, 'comments': comments}
-        response = requests.post(issue_url, json=issue_data, headers=self.headers,
-            timeout=Importer._DEFAULT_TIME_OUT)
+        with metrics.stage('upload'):
+            response = self.client.post(issue_url, json=issue_data)
         if response.status_code == 202:
             return response
         elif response.status_code == 422:
@@ -239,51 +466,20 @@ class Importer:
                 "Initial import validation failed for issue '{}' due to the "
                 "following errors:\n{}".format(issue['title'], response.json())
             )
+        elif response.status_code >= 500:
+            # GitHub may have created the import anyway, the issue stays submitted for recover_submitted
+            raise StatusCheckError(
+                "Failed to POST issue: '{}' due to server error: {}, it may have been imported"
+                .format(issue['title'], response.status_code)
+            )
         else:
             raise RuntimeError(
                 "Failed to POST issue: '{}' due to unexpected HTTP status code: {}\nerrors:\n{}"
                 .format(issue['title'], response.status_code, response.json())
             )
 
-    def wait_for_issue_creation(self, status_url, wait = 3):
-        """
-        Check the status of a GitHub issue import.
-        If the status is 'pending', it sleeps, then rechecks until the status is
-        either 'imported' or 'failed'.
-        """
-        while True:  # keep checking until status is something other than 'pending'
-            time.sleep(wait)
-            response = requests.get(status_url, headers=self.headers,
-                timeout=Importer._DEFAULT_TIME_OUT)
-            if response.status_code == 404:
-                continue
-            elif response.status_code != 200:
-                raise RuntimeError(
-                    "Failed to check GitHub issue import status url: {} due to unexpected HTTP status code: {}"
-                    .format(status_url, response.status_code)
-                )
-
-            status = response.json()['status']
-            if status != 'pending':
-                break
-            if not wait:
-                time.sleep(1)
-
-        if status == 'imported':
-            print("Imported Issue:", response.json()['issue_url'].replace('api.github.com/repos/', 'github.com/'))
-        elif status == 'failed':
-            raise RuntimeError(
-                "Failed to import GitHub issue due to the following errors:\n{}"
-                .format(response.json())
-            )
-        else:
-            raise RuntimeError(
-                "Status check for GitHub issue import returned unexpected status: '{}'"
-                .format(status)
-            )
-        return response
-
     def convert_relationships_to_comments(self, issue):
+        """Returns the comments listing the issue's Jira relationships."""
         mapping = (
             ('relates-to', 'relates to'),
             ('duplicates', 'duplicates'),
@@ -298,83 +494,152 @@ class Importer:
             ('is-caused-by', 'is caused by'),
         )
 
+        comments = []
         for key, name in mapping:
             items = []
-            for item in issue.pop(key, []):
-                item = self._replace_jira_with_github_id(item)
+            for item in issue.links.get(key, []):
                 url = get_github_search_url(item, 'title')
                 items.append(f'<a href="{url}">{item}</a>')
             if items:
                 links = ' '.join(items)
-                issue['comments'].append({"body": f'<i>[Originally {name}: {links}]</i>'})
-
-    def _replace_jira_with_github_id(self, text):
-        result = text
-        # for pattern, replacement in self.jira_issue_replace_patterns.items():
-        #     result = re.sub(pattern, Importer._PLACEHOLDER_PREFIX +
-        #                     replacement + Importer._PLACEHOLDER_SUFFIX, result)
-        return result
-
-    # def post_process_comments(self):
-    #     """
-    #     Starts post-processing all issue comments.
-    #     """
-    #     comment_url = self.github_url + '/issues/comments'
-    #     self._post_process_comments(comment_url)
-
-    # def _post_process_comments(self, url):
-    #     """
-    #     Paginates through all issue comments and replaces the issue id placeholders with the correct issue ids.
-    #     """
-    #     print("listing comments using " + url)
-    #     response = requests.get(url, headers=self.headers,
-    #         timeout=Importer._DEFAULT_TIME_OUT)
-    #     if response.status_code != 200:
-    #         raise RuntimeError(
-    #             "Failed to list all comments due to unexpected HTTP status code: {}".format(
-    #                 response.status_code)
-    #         )
-
-    #     comments = response.json()
-    #     for comment in comments:
-    #         print("handling comment " + comment['url'])
-    #         body = comment['body']
-    #         if Importer._PLACEHOLDER_PREFIX in body:
-    #             newbody = self._replace_github_id_placeholder(body)
-    #             self._patch_comment(comment['url'], newbody)
-    #     try:
-    #         next_comments = response.links["next"]
-    #         if next_comments:
-    #             next_url = next_comments['url']
-    #             self._post_process_comments(next_url)
-    #     except KeyError:
-    #         print('no more pages for comments: ')
-    #         for key, value in response.links.items():
-    #             print(key)
-    #             print(value)
-
-    def _replace_github_id_placeholder(self, text):
-        result = text
-        # pattern = Importer._PLACEHOLDER_PREFIX + Importer._GITHUB_ISSUE_PREFIX + \
-        #     r'(\d+)' + Importer._PLACEHOLDER_SUFFIX
-        # result = re.sub(pattern, Importer._GITHUB_ISSUE_PREFIX + r'\1', result)
-        # pattern = Importer._PLACEHOLDER_PREFIX + \
-        #     r'(\d+)' + Importer._PLACEHOLDER_SUFFIX
-        # result = re.sub(pattern, r'\1', result)
-        return result
-
-    # def _patch_comment(self, url, body):
-    #     """
-    #     Patches a single comment body of a Github issue.
-    #     """
-    #     print("patching comment " + url)
-    #     # print("new body:" + body)
-    #     patch_data = {'body': body}
-    #     # print(patch_data)
-    #     response = requests.patch(url, json=patch_data, headers=self.headers,
-    #         timeout=Importer._DEFAULT_TIME_OUT)
-    #     if response.status_code != 200:
-    #         raise RuntimeError(
-    #             "Failed to patch comment {} due to unexpected HTTP status code: {} ; text: {}".format(
-    #                 url, response.status_code, response.text)
-    #         )
+                comments.append(Comment(f'<i>[Originally {name}: {links}]</i>'))
+        return comments
+
+    def post_process_comments(self):
+        """
+        Post-import pass: the search links to Jira keys in issue bodies and comments
+        are replaced by direct links to the imported GitHub issues, using the
+        key to issue id map of the checkpoint.
+        Only the issues not linked yet, the ones given new comments in this run and the ones
+        referencing keys imported since they were linked are read, and only the bodies that
+        change are patched, concurrently. Linked issues are recorded in the checkpoint with
+        the referenced keys left unlinked, so an interrupted pass is simply run again.
+        """
+        github_ids = self.checkpoint.imported()
+        linked = self.checkpoint.linked()
+        keys = {key for key in github_ids
+                if key not in linked or key in self.commented_keys or not linked[key].isdisjoint(github_ids)}
+        if not keys:
+            return
+        print('Linking references in %d imported issues...' % len(keys))
+
+        # [(jira key, url, new body)], errors and referenced keys not imported by jira key
+        patches = []
+        errors = defaultdict(list)
+        unresolved = defaultdict(set)
+        if len(keys) * 2 > len(github_ids):
+            # e.g. after a full import, listing the whole repository takes far fewer requests
+            numbers = {github_ids[key]: key for key in keys}
+            for url in (self.github_url + '/issues?state=all&per_page=100',
+                        self.github_url + '/issues/comments?per_page=100'):
+                for item in self._iter_pages(url):
+                    number = item['number'] if 'number' in item else int(item['issue_url'].rsplit('/', 1)[1])
+                    if number in numbers:
+                        patches.extend(self._link_patches(numbers[number], [item], github_ids, unresolved))
+        else:
+            def read(key):
+                issue_url = '%s/issues/%d' % (self.github_url, github_ids[key])
+                r = self.client.get(issue_url)
+                if r.status_code != 200:
+                    raise RuntimeError('Failed to read %s due to unexpected HTTP status code: %d' % (issue_url, r.status_code))
+                return [r.json()] + list(self._iter_pages(issue_url + '/comments?per_page=100'))
+
+            with ThreadPoolExecutor(max_workers=batch_size) as pool:
+                futures = {pool.submit(read, key): key for key in keys}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        patches.extend(self._link_patches(key, future.result(), github_ids, unresolved))
+                    except (RuntimeError, requests.RequestException) as ex:
+                        errors[key].append(str(ex))
+        print('%d issue and comment bodies to update' % len(patches))
+
+        def patch(args):
+            key, url, body = args
+            return key, url, self.client.patch(url, json={'body': body})
+
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            for key, url, r in pool.map(patch, patches):
+                if r.status_code != 200:
+                    errors[key].append('Failed to patch %s due to unexpected HTTP status code: %d %s'
+                                       % (url, r.status_code, r.text))
+        for key in sorted(keys):
+            for error in errors[key]:
+                print(error)
+            if not errors[key]:
+                self.checkpoint.mark_linked(key, unresolved[key])
+
+    def _link_patches(self, key, items, github_ids, unresolved):
+        """
+        Returns the (jira key, url, new body) of the items, issues or comments, whose references change.
+        The referenced keys that are not imported are added to unresolved[key].
+        """
+        patches = []
+        for item in items:
+            body = item.get('body') or ''
+            new_body = self._link_jira_keys(body, github_ids, unresolved[key])
+            if new_body != body:
+                patches.append((key, item['url'], new_body))
+        return patches
+
+    def link_epic_children(self):
+        """
+        Lists the children of each imported epic at the end of the epic's body.
+        Children are grouped per epic from the import data, so each epic costs one
+        read and at most one update, and the updates run concurrently.
+        Children already listed are kept and an unchanged list is not written again,
+        so the stage can be re-run or resumed at any time.
+        """
+        github_ids = self.checkpoint.imported()
+        children = defaultdict(set)
+        for issue in self.project.get_issues():
+            if issue.epic in github_ids and issue.key in github_ids:
+                children[issue.epic].add(github_ids[issue.key])
+        print('Linking children of %d epics...' % len(children))
+
+        def update(epic_key):
+            url = '%s/issues/%d' % (self.github_url, github_ids[epic_key])
+            r = self.client.get(url)
+            if r.status_code != 200:
+                return epic_key, r
+            body = r.json()['body'] or ''
+            new_body = self._with_epic_children(body, children[epic_key])
+            if new_body == body:
+                return epic_key, None
+            return epic_key, self.client.patch(url, json={'body': new_body})
+
+        with ThreadPoolExecutor(max_workers=batch_size) as pool:
+            for epic_key, r in pool.map(update, sorted(children)):
+                if r is None:
+                    continue
+                if r.status_code == 200:
+                    print('Linked %d children to epic %s' % (len(children[epic_key]), epic_key))
+                else:
+                    print('Failed to link children to epic %s due to unexpected HTTP status code: %d'
+                          % (epic_key, r.status_code), r.text)
+
+    def _with_epic_children(self, body, children):
+        """Returns body with its epic children section replaced by one listing children and the ones listed before."""
+        start = body.find(Importer._EPIC_CHILDREN)
+        if start < 0:
+            start = len(body)
+        else:
+            children = children | {int(n) for n in Importer._EPIC_CHILD.findall(body, start)}
+        return body[:start] + Importer._EPIC_CHILDREN + '\n'.join('- #%d' % n for n in sorted(children))
+
+    def _link_jira_keys(self, text, github_ids, missing):
+        """
+        Replaces the GitHub search links made by get_github_search_url for a Jira key
+        with a link to the GitHub issue, when the key was imported, else adds it to missing.
+        """
+        if '../issues?q=' not in text:
+            return text
+
+        def link(m):
+            github_id = github_ids.get(m[1])
+            if github_id is None:
+                missing.add(m[1])
+                return m[0]
+            return '../issues/%d' % github_id
+
+        return Importer._SEARCH_LINK.sub(link, text)
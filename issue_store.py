@@ -0,0 +1,38 @@
+import json
+
+from records import Issue
+
+
+class JsonlIssueStore:
+    """
+    Disk-backed replacement for the in-memory issue list of a Project.
+    Issues are appended to a JSON lines file as they are parsed and read back
+    one at a time on every iteration, so memory use does not depend on the
+    number of issues. The file is rewritten on every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w')
+        self._count = 0
+
+    def append(self, issue):
+        self._file.write(json.dumps(issue.to_dict(), separators=(',', ':')))
+        self._file.write('\n')
+        self._count += 1
+
+    def extend(self, issues):
+        for issue in issues:
+            self.append(issue)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        self._file.flush()
+        with open(self.path) as file:
+            for line in file:
+                yield Issue.from_dict(json.loads(line))
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Posts a "moved to GitHub" comment on every imported Jira issue.
+The imported issues are read from the import checkpoint, and the issues
+already commented on are recorded there too, so re-runs only post what is missing.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from checkpoint import ImportCheckpoint
+
+jira_server = os.getenv('JIRA_MIGRATION_JIRA_URL') or input('Jira base url [default "https://issues.jenkins.io"]: ') or 'https://issues.jenkins.io'
+jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME') or input('Jira project name: ') or 'INFRA'
+jira_user = os.getenv('JIRA_MIGRATION_JIRA_USER') or input('Jira user name: ')
+jira_token = os.getenv('JIRA_MIGRATION_JIRA_TOKEN') or input('Jira password or API token: ')
+ac = os.getenv('JIRA_MIGRATION_GITHUB_NAME') or input('GitHub account name (user/org): ') or 'jenkins-infra'
+repo = os.getenv('JIRA_MIGRATION_GITHUB_REPO') or input('GitHub repository name: ') or 'helpdesk'
+concurrency = int(os.getenv('JIRA_MIGRATION_JIRA_COMMENT_CONCURRENCY', 8))
+time_out = 60.0
+
+github = f'https://github.com/{ac}/{repo}/issues'
+
+session = requests.Session()
+session.auth = (jira_user, jira_token)
+# retries failed connections and rate limiting, honouring Retry-After: a comment POST that
+# got a server error or no response may have been posted already, it is left to the next run
+retries = Retry(total=5, connect=5, read=0, backoff_factor=1, status_forcelist=(429,),
+                allowed_methods=None, respect_retry_after_header=True)
+session.mount('http://', HTTPAdapter(pool_maxsize=concurrency, max_retries=retries))
+session.mount('https://', HTTPAdapter(pool_maxsize=concurrency, max_retries=retries))
+
+
+def comment_body(key, github_id):
+    return (f'For your information, [all {jira_proj} issues|{jira_server}/projects/{jira_proj}/issues/] '
+            f'have been transferred to GitHub: {github}\n\n'
+            f'Here is the direct link to this issue in GitHub: {github}/{github_id}\n'
+            f'And here is the link to a search for related issues: {github}?q=%22{key}%22\n\n'
+            '(Note: this is an automated bulk comment)')
+
+
+def post_comment(key, github_id):
+    # https://developer.atlassian.com/server/jira/platform/jira-rest-api-examples/#adding-a-comment
+    response = session.post(f'{jira_server}/rest/api/2/issue/{key}/comment',
+                            json={'body': comment_body(key, github_id)}, timeout=time_out)
+    return response.status_code
+
+
+checkpoint = ImportCheckpoint(os.getenv('JIRA_MIGRATION_CHECKPOINT', 'jira-import-checkpoint.sqlite'))
+done = checkpoint.commented()
+todo = {key: github_id for key, github_id in checkpoint.imported().items() if key not in done}
+print(f'Commenting on {len(todo)} Jira issues ({len(done)} already done)...')
+
+failed = 0
+with ThreadPoolExecutor(max_workers=concurrency) as pool:
+    futures = {pool.submit(post_comment, key, github_id): key for key, github_id in todo.items()}
+    for future in as_completed(futures):
+        key = futures[future]
+        try:
+            status_code = future.result()
+        except requests.RequestException as ex:
+            status_code = ex
+        if status_code == 201:
+            checkpoint.mark_commented(key)
+            print(f'{key} -> {github}/{todo[key]}')
+        else:
+            failed += 1
+            print(f'Failed to comment on {key}:', status_code)
+
+checkpoint.close()
+if failed:
+    print(f'{failed} comments failed, run again to retry them')
+else:
+    print('Complete')
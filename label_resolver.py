@@ -0,0 +1,90 @@
+import os
+import re
+
+from utils import fetch_labels_mapping, fetch_allowed_labels
+
+
+class LabelResolver:
+    """
+    Turns Jira labels into GitHub labels, built once from labels_mapping.txt and allowed_labels.txt.
+    Mapping keys and allow-list entries are exact labels, prefixes ending with '*'
+    or regular expressions between slashes, e.g.
+
+        jira-component:*=component:*
+        /(\\d+)\\.x/=version-\\1
+
+    Exact entries are looked up in hash tables and the results of the prefix
+    and regex rules are cached, so resolving a label takes constant time.
+    """
+
+    def __init__(self, labels_mapping=None, allowed_labels=None, include_components=True):
+        self.include_components = include_components
+        self._mapping = {}
+        self._mapping_prefixes = []
+        self._mapping_patterns = []
+        for key, value in (labels_mapping or {}).items():
+            if len(key) > 1 and key.startswith('/') and key.endswith('/'):
+                self._mapping_patterns.append((re.compile(key[1:-1]), value))
+            elif key.endswith('*'):
+                self._mapping_prefixes.append((key[:-1], value))
+            else:
+                self._mapping[key] = value
+
+        allowed = set()
+        self._allowed_prefixes = []
+        self._allowed_patterns = []
+        for label in allowed_labels or ():
+            if len(label) > 1 and label.startswith('/') and label.endswith('/'):
+                self._allowed_patterns.append(re.compile(label[1:-1]))
+            elif label.endswith('*'):
+                self._allowed_prefixes.append(label[:-1])
+            else:
+                allowed.add(label)
+        self._allowed = frozenset(allowed)
+        self.has_allow_list = bool(allowed_labels)
+        self._mapped = {}
+        self._resolved = {}
+
+    @classmethod
+    def from_files(cls):
+        return cls(fetch_labels_mapping(), fetch_allowed_labels(),
+                   os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true') == 'true')
+
+    def map(self, label):
+        """Returns the mapped label: an exact mapping first, then the first matching prefix or regex rule."""
+        try:
+            return self._mapped[label]
+        except KeyError:
+            mapped = self._mapped[label] = self._map(label)
+            return mapped
+
+    def _map(self, label):
+        mapped = self._mapping.get(label)
+        if mapped is not None:
+            return mapped
+        for prefix, value in self._mapping_prefixes:
+            if label.startswith(prefix):
+                return value[:-1] + label[len(prefix):] if value.endswith('*') else value
+        for pattern, value in self._mapping_patterns:
+            m = pattern.fullmatch(label)
+            if m:
+                return m.expand(value)
+        return label
+
+    def is_allowed(self, label):
+        return (label in self._allowed
+                or any(label.startswith(prefix) for prefix in self._allowed_prefixes)
+                or any(pattern.fullmatch(label) for pattern in self._allowed_patterns))
+
+    def resolve(self, label):
+        """Returns the GitHub label of a label to create, None when it is not in the allow-list."""
+        try:
+            return self._resolved[label]
+        except KeyError:
+            mapped = self.map(label)
+            resolved = self._resolved[label] = mapped if self.is_allowed(mapped) else None
+            return resolved
+
+    def resolve_issue_label(self, label):
+        """Returns the GitHub label of an issue label, which is only dropped when an allow-list is configured."""
+        return self.resolve(label) if self.has_allow_list else self.map(label)
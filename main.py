@@ -4,59 +4,90 @@ from collections import namedtuple
 import os.path
 from project import Project
 from importer import Importer
+from checkpoint import ImportCheckpoint
+from issue_store import JsonlIssueStore
 from labelcolourselector import LabelColourSelector
-from utils import read_xml_files
-
-file_names = os.getenv('JIRA_MIGRATION_FILE_PATHS') or input(
-    'Path to Jira XML query file (semi-colon separate for multiple files, directories are accepted): ')
-all_xml_files = read_xml_files(file_names)
-
-jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME') or input('Jira project name: ') or 'INFRA'
-jira_done_id = os.getenv('JIRA_MIGRATION_JIRA_DONE_ID') or input('Jira Done statusCategory ID [default "3"]: ') or '3'
-jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL') or input('Jira base url [default "https://issues.jenkins.io"]: ') or 'https://issues.jenkins.io'
-ac = os.getenv('JIRA_MIGRATION_GITHUB_NAME') or input('GitHub account name (user/org): ') or 'jenkins-infra'
-repo = os.getenv('JIRA_MIGRATION_GITHUB_REPO') or input('GitHub repository name: ') or 'helpdesk'
-pat = os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN') or input('Github Personal Access Token: ') # or '<your-github-pat>'
-start_from_issue = input('Start from [default "0" (beginning)]: ') or '0'
-
-Options = namedtuple("Options", "accesstoken account repo")
-opts = Options(accesstoken=pat, account=ac, repo=repo)
-
-project = Project(jira_proj, jira_done_id, jira_base_url)
-
-tickets_to_import = os.getenv('JIRA_TICKETS', '').replace(',', ' ').split()
-if tickets_to_import:
-    print('JIRA_TICKETS:', tickets_to_import)
-tickets_to_skip = os.getenv('JIRA_TICKETS_SKIP', '').replace(',', ' ').split()
-if tickets_to_skip:
-    print('JIRA_TICKETS_SKIP:', tickets_to_skip)
-
-for f in all_xml_files:
-    for item in f.channel.item:
-        key = item.key.text
-        if (tickets_to_import and key not in tickets_to_import) or (tickets_to_skip and key in tickets_to_skip):
-            print('Skipping %s...' % key)
-            continue
-        project.add_item(item)
-
-project.prettify()
-
-input('Press any key to begin...')
-
-'''
-Steps:
-  1. Create any milestones
-  2. Create any labels
-  3. Create each issue with comments, linking them to milestones and labels
-  4: Post-process all comments to replace issue id placeholders with the real ones
-'''
-importer = Importer(opts, project)
-colourSelector = LabelColourSelector(project)
-
-importer.import_milestones()
-
-if int(start_from_issue) == 0:
+from metrics import metrics
+from parse_cache import ParseCache
+from payload_shards import PayloadShards
+from filters import IssueFilter
+
+# import: parse and import, compile: parse and write the payloads, upload: import the written payloads
+mode = os.getenv('JIRA_MIGRATION_MODE', 'import')
+payload_dir = os.getenv('JIRA_MIGRATION_PAYLOAD_DIR', 'jira-payloads')
+
+
+def main():
+    # parse workers re-import this module when they are spawned, so nothing may run on import
+    if mode != 'upload':
+        file_names = os.getenv('JIRA_MIGRATION_FILE_PATHS') or input(
+            'Path to Jira XML query file (semi-colon separate for multiple files, directories are accepted): ')
+
+    jira_proj = os.getenv('JIRA_MIGRATION_JIRA_PROJECT_NAME') or input('Jira project name: ') or 'INFRA'
+    jira_done_id = os.getenv('JIRA_MIGRATION_JIRA_DONE_ID') or input('Jira Done statusCategory ID [default "3"]: ') or '3'
+    jira_base_url = os.getenv('JIRA_MIGRATION_JIRA_URL') or input('Jira base url [default "https://issues.jenkins.io"]: ') or 'https://issues.jenkins.io'
+    Options = namedtuple("Options", "accesstoken account repo")
+    if mode == 'compile':
+        # no Github calls are made
+        opts = Options(accesstoken=None, account=None, repo=None)
+    else:
+        ac = os.getenv('JIRA_MIGRATION_GITHUB_NAME') or input('GitHub account name (user/org): ') or 'jenkins-infra'
+        repo = os.getenv('JIRA_MIGRATION_GITHUB_REPO') or input('GitHub repository name: ') or 'helpdesk'
+        pat = os.getenv('JIRA_MIGRATION_GITHUB_ACCESS_TOKEN') or input('Github Personal Access Token: ') # or '<your-github-pat>'
+        opts = Options(accesstoken=pat, account=ac, repo=repo)
+
+    if mode == 'upload':
+        shards = PayloadShards(payload_dir)
+        project = Project(jira_proj, jira_done_id, jira_base_url, shards)
+        shards.load_manifest(project)
+    else:
+        issue_store_path = os.getenv('JIRA_MIGRATION_ISSUE_STORE')
+        project = Project(jira_proj, jira_done_id, jira_base_url,
+                          JsonlIssueStore(issue_store_path) if issue_store_path else None)
+
+        parse_processes = int(os.getenv('JIRA_MIGRATION_PARSE_PROCESSES', os.cpu_count()))
+        project.add_files(file_names, IssueFilter.from_env(), parse_processes, ParseCache.from_env())
+        project.media_cache.prefetch(int(os.getenv('JIRA_MIGRATION_MEDIA_WORKERS', 8)))
+
+    project.prettify()
+    metrics.write()
+
+    if mode == 'compile':
+        Importer(opts, project, None).compile_payloads(PayloadShards(payload_dir))
+        return
+
+    input('Press any key to begin...')
+
+    '''
+    Steps:
+      1. Create any milestones
+      2. Create any labels
+      3. Create each issue with comments, linking them to milestones and labels
+      4: Post-process all issues and comments to replace the Jira key search links with direct links
+      5. List the children of each epic in the epic's body
+    '''
+    checkpoint = ImportCheckpoint(os.getenv('JIRA_MIGRATION_CHECKPOINT', 'jira-import-checkpoint.sqlite'))
+    if len(checkpoint):
+        print('Resuming from checkpoint %s (%d issues recorded)' % (checkpoint.path, len(checkpoint)))
+
+    importer = Importer(opts, project, checkpoint)
+    colourSelector = LabelColourSelector(project)
+
+    importer.import_milestones()
     importer.import_labels(colourSelector)
 
-importer.import_issues(int(start_from_issue))
-# importer.post_process_comments()
+    # compiled payloads have no comments to sync, the checkpoint still skips imported issues
+    if os.getenv('JIRA_MIGRATION_SYNC') == 'delta' and mode != 'upload':
+        importer.sync_issues()
+    else:
+        importer.import_issues()
+        importer.record_high_water_mark()
+    importer.post_process_comments()
+    importer.link_epic_children()
+    checkpoint.close()
+    metrics.write()
+    print('Run metrics written to', metrics.path)
+
+
+if __name__ == '__main__':
+    main()
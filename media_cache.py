@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class MediaCache:
+    """
+    Points Jira attachments to the media cache (JIRA_MIGRATION_MEDIA_CACHE).
+    While parsing, attachment paths are only collected, the cache is warmed
+    afterwards by prefetch() with a bounded pool of concurrent requests.
+    Paths already cached are kept in a local index file, so they are requested once.
+    """
+    _DEFAULT_TIME_OUT = 120.0
+
+    def __init__(self, base_url, index_path='media-cache-index.txt'):
+        self.base_url = base_url
+        self.index_path = index_path
+        self.requested = set()
+
+    def url_for(self, path):
+        """Rewriter callback: returns the cache url of an attachment path (id and query string)."""
+        if not self.base_url:
+            return None
+        self.requested.add(path)
+        return self.base_url + path
+
+    def cached(self):
+        if not os.path.exists(self.index_path):
+            return set()
+        with open(self.index_path) as file:
+            return set(file.read().splitlines())
+
+    def prefetch(self, workers=8):
+        todo = sorted(self.requested - self.cached())
+        if not todo:
+            return
+        print('Caching %d attachments (%d already cached)...' % (len(todo), len(self.requested) - len(todo)))
+
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_maxsize=workers))
+        session.mount('https://', HTTPAdapter(pool_maxsize=workers))
+
+        def fetch(path):
+            test_url = self.base_url + path + ('&' if '?' in path else '?') + 'check=true'
+            return session.get(test_url, timeout=MediaCache._DEFAULT_TIME_OUT).status_code
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool, open(self.index_path, 'a') as index:
+            futures = {pool.submit(fetch, path): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    status_code = future.result()
+                except requests.RequestException as ex:
+                    status_code = ex
+                if status_code == 200:
+                    index.write(path + '\n')
+                else:
+                    failed += 1
+                    print('Cache media failed:', path, status_code)
+        print('Cached %d attachments, %d failed' % (len(todo) - failed, failed))
@@ -0,0 +1,145 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# upper bounds, in seconds, of the latency histogram buckets
+_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, float('inf'))
+_REPO_PREFIX = re.compile(r'^/repos/[^/]+/[^/]+')
+_NUMBER = re.compile(r'/\d+(?=/|$)')
+
+
+class Metrics:
+    """
+    Thread-safe run metrics: per-stage latency histograms, HTTP calls by endpoint
+    and status, retry backoff time and imported issues per minute.
+    write() dumps them as JSON, maybe_write() does so at most every `interval` seconds.
+    """
+
+    def __init__(self, path='jira-migration-metrics.json', interval=60.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._last_write = self._started
+        self._stages = {}
+        self._http = Counter()
+        self._counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, iterable):
+        """Yields from iterable, recording the time spent producing each item as stage name."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, time.perf_counter() - start)
+            yield item
+
+    def _stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'buckets': [0] * len(_BUCKETS)}
+        return stage
+
+    def record(self, name, seconds):
+        with self._lock:
+            stage = self._stage(name)
+            stage['count'] += 1
+            stage['total'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+            stage['buckets'][next(i for i, bound in enumerate(_BUCKETS) if seconds <= bound)] += 1
+
+    def record_total(self, name, count, seconds):
+        """Records count calls of stage name that took seconds in all, for calls too fast to record one by one."""
+        if not count:
+            return
+        mean = seconds / count
+        with self._lock:
+            stage = self._stage(name)
+            stage['count'] += count
+            stage['total'] += seconds
+            # only the mean is known
+            stage['max'] = max(stage['max'], mean)
+            stage['buckets'][next(i for i, bound in enumerate(_BUCKETS) if mean <= bound)] += count
+
+    def count_http(self, method, url, status_code):
+        # /repos/owner/repo/import/issues/123 -> /import/issues/:id
+        endpoint = _NUMBER.sub('/:id', _REPO_PREFIX.sub('', urlparse(url).path))
+        with self._lock:
+            self._http['%s %s %s' % (method, endpoint, status_code)] += 1
+
+    def count_retry(self, seconds):
+        with self._lock:
+            self._counters['retries'] += 1
+            self._counters['backoff_seconds'] += seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def snapshot(self, reset=False):
+        """Returns the raw metrics, see merge. With reset, they are cleared afterwards."""
+        with self._lock:
+            snapshot = {'stages': {name: dict(stage, buckets=list(stage['buckets'])) for name, stage in self._stages.items()},
+                        'http': dict(self._http),
+                        'counters': dict(self._counters)}
+            if reset:
+                self._stages.clear()
+                self._http.clear()
+                self._counters.clear()
+            return snapshot
+
+    def merge(self, snapshot):
+        """Adds the metrics of another process, e.g. a parse worker."""
+        with self._lock:
+            for name, other in snapshot['stages'].items():
+                stage = self._stages.get(name)
+                if stage is None:
+                    self._stages[name] = dict(other, buckets=list(other['buckets']))
+                    continue
+                stage['count'] += other['count']
+                stage['total'] += other['total']
+                stage['max'] = max(stage['max'], other['max'])
+                stage['buckets'] = [a + b for a, b in zip(stage['buckets'], other['buckets'])]
+            self._http.update(snapshot['http'])
+            self._counters.update(snapshot['counters'])
+
+    def report(self):
+        snapshot = self.snapshot()
+        elapsed = time.time() - self._started
+        for stage in snapshot['stages'].values():
+            stage['mean'] = stage['total'] / stage['count']
+            stage['buckets'] = {('le_%g' % bound): count for bound, count in zip(_BUCKETS, stage['buckets'])}
+        snapshot['elapsed_seconds'] = elapsed
+        snapshot['issues_per_minute'] = snapshot['counters'].get('issues_imported', 0) / elapsed * 60 if elapsed else 0.0
+        return snapshot
+
+    def write(self):
+        report = self.report()
+        with open(self.path + '.tmp', 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
+        self._last_write = time.time()
+
+    def maybe_write(self):
+        if time.time() - self._last_write >= self.interval:
+            self.write()
+
+
+metrics = Metrics(os.getenv('JIRA_MIGRATION_METRICS', 'jira-migration-metrics.json'),
+                  float(os.getenv('JIRA_MIGRATION_METRICS_INTERVAL', 60)))
@@ -0,0 +1,96 @@
+import glob
+import hashlib
+import os
+import pickle
+import re
+from datetime import datetime
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# everything that shapes the transformed issues: the code, the mapping files and the settings
+_SOURCES = ('project.py', 'records.py', 'utils.py', 'html_rewriter.py', 'label_resolver.py', 'media_cache.py', 'filters.py')
+_MAPPING_FILES = ('labels_mapping.txt', 'allowed_labels.txt', 'people_mapping.txt', 'jira_user_mapping.txt')
+_SETTINGS = ('JIRA_MIGRATION_MEDIA_CACHE', 'JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS')
+
+
+def _canonical(value):
+    """A representation of value that is the same in every run, e.g. for a filter holding sets."""
+    if isinstance(value, (set, frozenset)):
+        return sorted(_canonical(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, dict):
+        return sorted((k, _canonical(v)) for k, v in value.items())
+    if isinstance(value, re.Pattern):
+        return value.pattern
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, '__dict__'):
+        return [type(value).__name__, _canonical(vars(value))]
+    return value
+
+
+def _file_digest(file_name):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk cache of transformed XML exports: per input file, the issues, histograms,
+    epic mapping and attachment paths, pickled with protocol 5.
+    An entry is keyed by the file content plus everything else that affects the
+    output (code, mapping files, settings, project and filter), so it is simply
+    not found when any of them changed. Only the latest entry of a file is kept.
+    Note that the 'imported' date in the issue bodies is the date of the parse.
+    """
+
+    def __init__(self, directory='.jira-cache'):
+        self.directory = directory
+        digest = hashlib.blake2b(digest_size=20)
+        for file_name in [os.path.join(_HERE, source) for source in _SOURCES] + list(_MAPPING_FILES):
+            digest.update(file_name.encode())
+            if os.path.exists(file_name):
+                digest.update(_file_digest(file_name).encode())
+        for name in _SETTINGS:
+            digest.update(('%s=%s' % (name, os.getenv(name))).encode())
+        self.settings = digest.hexdigest()
+
+    @classmethod
+    def from_env(cls):
+        """The cache in JIRA_MIGRATION_PARSE_CACHE (default .jira-cache), None when it is set empty."""
+        directory = os.getenv('JIRA_MIGRATION_PARSE_CACHE', '.jira-cache')
+        return cls(directory) if directory else None
+
+    def _path(self, file_name, key):
+        prefix = hashlib.blake2b(os.path.abspath(file_name).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.directory, '%s-%s.pickle' % (prefix, key)), prefix
+
+    def key(self, file_name, *settings):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(self.settings.encode())
+        digest.update(_file_digest(file_name).encode())
+        digest.update(repr(_canonical(settings)).encode())
+        return digest.hexdigest()
+
+    def load(self, file_name, key):
+        path, _ = self._path(file_name, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError) as ex:
+            print('Ignoring unreadable parse cache entry %s: %s' % (path, ex))
+            return None
+
+    def store(self, file_name, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path, prefix = self._path(file_name, key)
+        for stale in glob.glob(os.path.join(self.directory, prefix + '-*.pickle')):
+            os.remove(stale)
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(value, file, protocol=5)
+        os.replace(path + '.tmp', path)
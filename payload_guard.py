@@ -0,0 +1,66 @@
+import json
+
+from metrics import metrics
+
+# GitHub rejects issue and comment bodies longer than this
+MAX_BODY_LENGTH = 65536
+_TRIMMED = '\n\n<i>[Trimmed, too long for Github, see the original Jira issue]</i>'
+
+
+def _size(value):
+    # serialized as requests does
+    return len(json.dumps(value).encode())
+
+
+class PayloadGuard:
+    """
+    Keeps Issue Import API payloads within what GitHub accepts, instead of having them rejected with a 422:
+    bodies over MAX_BODY_LENGTH characters are trimmed, and when the payload has more
+    than max_comments comments or is larger than max_bytes serialized, the comments
+    that don't fit are split off, to be added to the issue once it is imported.
+    """
+
+    def __init__(self, max_bytes=900000, max_comments=200):
+        self.max_bytes = max_bytes
+        self.max_comments = max_comments
+
+    def fit(self, payload):
+        """Returns the payload to upload and the list of comments to add after the import."""
+        issue = payload['issue']
+        issue['body'] = self._trim(issue['body'])
+        for comment in payload['comments']:
+            comment['body'] = self._trim(comment['body'])
+
+        comments = payload['comments']
+        size = _size(payload)
+        if len(comments) <= self.max_comments and size <= self.max_bytes:
+            return payload, []
+
+        kept = 0
+        size = _size({'issue': issue, 'comments': []})
+        for comment in comments[:self.max_comments]:
+            # 2 for the separating comma
+            size += _size(comment) + 2
+            if size > self.max_bytes:
+                break
+            kept += 1
+        print('Payload of %d comments too large, %d comments added after the import' % (len(comments), len(comments) - kept))
+        metrics.count('payloads_split')
+        payload['comments'] = comments[:kept]
+        return payload, comments[kept:]
+
+    @staticmethod
+    def _trim(body, limit=MAX_BODY_LENGTH):
+        if body is None or len(body) <= limit:
+            return body
+        metrics.count('bodies_trimmed')
+        return body[:limit - len(_TRIMMED)] + _TRIMMED
+
+    @staticmethod
+    def follow_up_body(comment):
+        """The body of a comment added after the import, which can't keep its creation date."""
+        created_at = comment.get('created_at')
+        if not created_at:
+            return PayloadGuard._trim(comment['body'])
+        header = '<i>Originally posted on %s</i>\n' % created_at
+        return header + PayloadGuard._trim(comment['body'], MAX_BODY_LENGTH - len(header))
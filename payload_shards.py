@@ -0,0 +1,85 @@
+import glob
+import gzip
+import json
+import os
+
+from records import CompiledIssue
+
+_MANIFEST = 'manifest.json'
+
+
+class PayloadShards:
+    """
+    Compiled import payloads on disk, as gzip compressed JSON lines files of
+    shard_size issues each, plus a manifest with the project's milestone and label
+    histograms and epic mapping, which the upload needs to create milestones and labels.
+    It can stand in for the issue list of a Project, iterating yields CompiledIssue records.
+    """
+
+    def __init__(self, directory, shard_size=1000):
+        self.directory = directory
+        self.shard_size = shard_size
+        self._file = None
+        self._count = 0
+
+    def clear(self):
+        """Removes the shards and manifest of a previous compile."""
+        os.makedirs(self.directory, exist_ok=True)
+        for file_name in self._shard_files() + [os.path.join(self.directory, _MANIFEST)]:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        self._count = 0
+
+    def _shard_files(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'payloads-*.jsonl.gz')))
+
+    def append(self, issue):
+        if self._count % self.shard_size == 0:
+            self.close()
+            shard = os.path.join(self.directory, 'payloads-%05d.jsonl.gz' % (self._count // self.shard_size))
+            self._file = gzip.open(shard, 'wt', encoding='utf-8', compresslevel=6)
+        self._file.write(json.dumps(issue.to_dict(), separators=(',', ':')))
+        self._file.write('\n')
+        self._count += 1
+
+    def extend(self, issues):
+        for issue in issues:
+            self.append(issue)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        self.close()
+        for shard in self._shard_files():
+            with gzip.open(shard, 'rt', encoding='utf-8') as file:
+                for line in file:
+                    yield CompiledIssue.from_dict(json.loads(line))
+
+    def save_manifest(self, project):
+        self.close()
+        manifest = {'issues': self._count,
+                    'milestones': project.get_milestones(),
+                    'components': project.get_components(),
+                    'labels': project._project['Labels'],
+                    'types': project.get_types(),
+                    'epic_mapping': project.epic_mapping}
+        with open(os.path.join(self.directory, _MANIFEST), 'w') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+
+    def load_manifest(self, project):
+        """Adds the histograms and epic mapping of the compiled project to project."""
+        file_name = os.path.join(self.directory, _MANIFEST)
+        if not os.path.exists(file_name):
+            raise RuntimeError('No compiled payloads found in %s, run the compile mode first' % self.directory)
+        with open(file_name) as file:
+            manifest = json.load(file)
+        self._count = manifest['issues']
+        project._merge({'Milestones': manifest['milestones'], 'Components': manifest['components'],
+                        'Labels': manifest['labels'], 'Types': manifest['types'], 'Issues': []},
+                       manifest['epic_mapping'])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,40 +1,89 @@
 import os
 from collections import defaultdict
-from html.entities import name2codepoint
-from dateutil.parser import parse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from time import perf_counter
 from datetime import datetime
 import re
-import requests
 
-from utils import fetch_labels_mapping, fetch_allowed_labels, fetch_people_mapping, fetch_jira_user_mapping, get_github_search_url
+from html_rewriter import JiraHtmlRewriter
+from label_resolver import LabelResolver
+from media_cache import MediaCache
+from metrics import metrics
+from records import Issue
+from utils import fetch_people_mapping, fetch_jira_user_mapping, get_github_search_url, \
+    list_xml_files, iter_xml_file, convert_to_iso, timestamp_stats, merge_timestamp_stats
 
 
-media_cache = os.getenv('JIRA_MIGRATION_MEDIA_CACHE')
+# the Project of a process pool worker, made once by _init_worker, so the mapping files are read once per worker
+_worker_project = None
 
-def jira_attachement(m: re.Match[str]):
-    if not media_cache: return m[0]
 
-    url = media_cache + m[1]
-    test_url = url + ('&' if '?' in m[1] else '?') + 'check=true'
-    response = requests.get(test_url) # cache it
-    print('Cache media:', response.status_code)
-    return url
+def _init_worker(name, doneStatusCategoryId, jiraBaseUrl):
+    global _worker_project
+    _worker_project = Project(name, doneStatusCategoryId, jiraBaseUrl)
+
+
+def _transform_in_worker(file_name, accept, cache=None):
+    return _transform_file(_worker_project, file_name, accept, cache)
+
+
+def _transform_file(project, file_name, accept, cache=None):
+    """
+    Turns one XML export into issue records, histograms and metrics, with an empty project.
+    Workers are reused, so the project and the counters are reset once handed over.
+    With a ParseCache, the result of an unchanged file is loaded instead.
+    """
+    # an empty IssueFilter accepts everything, like no filter, so both share the cache entry
+    key = cache.key(file_name, project.name, project.doneStatusCategoryId, project.jiraBaseUrl, accept or None) \
+        if cache else None
+    transformed = cache.load(file_name, key) if cache else None
+    if transformed is not None:
+        print('Loaded %s from the parse cache' % file_name)
+        metrics.count('parse_cache_hits')
+    else:
+        project.add_file(file_name, accept)
+        transformed = project._take_results()
+        if cache:
+            cache.store(file_name, key, transformed)
+    return transformed + (timestamp_stats(reset=True), metrics.snapshot(reset=True))
 
 
 class Project:
 
-    def __init__(self, name, doneStatusCategoryId, jiraBaseUrl):
+    def __init__(self, name, doneStatusCategoryId, jiraBaseUrl, issue_store=None):
+        """
+        issue_store replaces the in-memory issue list, e.g. with a JsonlIssueStore;
+        it needs append, extend, len and iteration.
+        """
         self.name = name
         self.doneStatusCategoryId = doneStatusCategoryId
         self.jiraBaseUrl = jiraBaseUrl
-        self._project = {'Milestones': defaultdict(int), 'Components': defaultdict(
-            int), 'Labels': defaultdict(int), 'Types': defaultdict(int), 'Issues': []}
+        self._project = self._new_project(issue_store)
 
-        self.labels_mapping = fetch_labels_mapping()
-        self.approved_labels = fetch_allowed_labels()
+        self.label_resolver = LabelResolver.from_files()
         self.people_mapping = fetch_people_mapping()
         self.jira_user_mapping = fetch_jira_user_mapping()
         self.epic_mapping = {}
+        self.media_cache = MediaCache(os.getenv('JIRA_MIGRATION_MEDIA_CACHE'))
+        self.html_rewriter = JiraHtmlRewriter(jiraBaseUrl, self.media_cache.url_for)
+        # the html rewriting is timed in total, a metrics stage per call would cost more than the rewriting
+        self._html_calls = 0
+        self._html_seconds = 0.0
+
+    @staticmethod
+    def _new_project(issue_store=None):
+        return {'Milestones': defaultdict(int), 'Components': defaultdict(
+            int), 'Labels': defaultdict(int), 'Types': defaultdict(int),
+            'Issues': [] if issue_store is None else issue_store}
+
+    def _take_results(self):
+        """Returns what the files added so far produced, and starts over empty for the next file."""
+        results = (self._project, self.epic_mapping, self.media_cache.requested)
+        self._project = self._new_project()
+        self.epic_mapping = {}
+        self.media_cache.requested = set()
+        return results
 
     def get_milestones(self):
         return self._project['Milestones']
@@ -60,6 +109,59 @@ class Project:
         merge.update({'jira': 0})
         return merge
 
+    def add_files(self, file_path, accept=None, processes=1, cache=None):
+        """
+        Adds all items of the given XML exports (semi-colon separated, directories
+        are accepted). With more than one process, the files are transformed in
+        a process pool and the results are merged back in file order.
+        With a ParseCache, each file is transformed on its own and cached.
+        """
+        file_names = list_xml_files(file_path)
+        if processes <= 1 or len(file_names) <= 1:
+            if cache is None:
+                for file_name in file_names:
+                    self.add_file(file_name, accept)
+            else:
+                # one worker project for all files, this one may have an issue store
+                worker = Project(self.name, self.doneStatusCategoryId, self.jiraBaseUrl)
+                self._merge_results(map(_transform_file, repeat(worker), file_names, repeat(accept), repeat(cache)))
+            return
+
+        with ProcessPoolExecutor(max_workers=min(processes, len(file_names)), initializer=_init_worker,
+                                 initargs=(self.name, self.doneStatusCategoryId, self.jiraBaseUrl)) as pool:
+            self._merge_results(pool.map(_transform_in_worker, file_names, repeat(accept), repeat(cache)))
+
+    def _merge_results(self, results):
+        for project, epic_mapping, attachments, stats, file_metrics in results:
+            self._merge(project, epic_mapping)
+            self.media_cache.requested.update(attachments)
+            merge_timestamp_stats(stats)
+            metrics.merge(file_metrics)
+
+    def add_file(self, file_name, accept=None):
+        """
+        Adds the items of one XML export. accept is a predicate on the raw <item>
+        elements, e.g. an IssueFilter; rejected items are dropped without being transformed.
+        """
+        skipped = 0
+        for item in metrics.timed_iter('parse', iter_xml_file(file_name)):
+            if accept and not accept(item):
+                skipped += 1
+                continue
+            with metrics.stage('transform'):
+                self.add_item(item)
+        metrics.record_total('html', self._html_calls, self._html_seconds)
+        self._html_calls, self._html_seconds = 0, 0.0
+        if skipped:
+            print('Skipped %d items of %s' % (skipped, file_name))
+
+    def _merge(self, project, epic_mapping):
+        for name in ('Milestones', 'Components', 'Labels', 'Types'):
+            for key, count in project[name].items():
+                self._project[name][key] += count
+        self._project['Issues'].extend(project['Issues'])
+        self.epic_mapping.update(epic_mapping)
+
     def add_item(self, item):
         itemProject = self._projectFor(item)
         if itemProject != self.name:
@@ -67,19 +169,23 @@ class Project:
                   itemProject + ' current project: ' + self.name)
             return
 
-        self._append_item_to_project(item)
+        issue = self._create_issue(item)
+
+        self._add_milestone(item, issue)
 
-        self._add_milestone(item)
+        self._add_labels(item, issue)
 
-        self._add_labels(item)
+        self._add_subtasks(item, issue)
 
-        self._add_subtasks(item)
+        self._add_parenttask(item, issue)
 
-        self._add_parenttask(item)
+        self._add_comments(item, issue)
 
-        self._add_comments(item)
+        self._add_relationships(item, issue)
 
-        self._add_relationships(item)
+        self._resolve_labels(issue)
+
+        self._project['Issues'].append(issue)
 
     def prettify(self):
         def hist(h):
@@ -97,6 +203,8 @@ class Project:
         hist(self._project['Labels'])
         print
         print('Total Issues to Import: %d' % len(self._project['Issues']))
+        print('Timestamp conversions: %(calls)d (cache hits: %(hits)d, fast path: %(fast)d, dateutil: %(fallback)d)'
+              % timestamp_stats())
 
     def _projectFor(self, item):
         try:
@@ -105,7 +213,7 @@ class Project:
             result = item.key.text.split('-')[0]
         return result
 
-    def _append_item_to_project(self, item):
+    def _create_issue(self, item):
         closed = str(item.statusCategory.get('id')) == self.doneStatusCategoryId
         closed_at = ''
         if closed:
@@ -166,7 +274,7 @@ class Project:
         # set a default component if empty or missing
         if not hasattr(item, 'component') or not item.component:
             item.component = 'miscellaneous'
-        elif os.getenv('JIRA_MIGRATION_INCLUDE_COMPONENT_IN_LABELS', 'true') == 'true':
+        elif self.label_resolver.include_components:
             for component in item.component:
                 labels.append('jira-component:' + component.text.lower())
                 labels.append(component.text.lower())
@@ -195,23 +303,17 @@ class Project:
         # See if this issue is in an Epic
         epic_link = (self._get_epic(item) or "").strip()
 
-        unique_labels = list(set(labels))
-
-        self._project['Issues'].append({'title': item.title.text,
-                                        'key': item.key.text,
-                                        'body': body,
-                                        'created_at': self._convert_to_iso(item.created.text),
-                                        'closed_at': closed_at,
-                                        'updated_at': self._convert_to_iso(item.updated.text),
-                                        'assignee': self.people_mapping.get(assignee),
-                                        'milestone_name': milestone_name,
-                                        'closed': closed,
-                                        'labels': unique_labels,
-                                        'comments': [],
-                                        'epic': epic_link,
-                                        })
-        if not self._project['Issues'][-1]['closed_at']:
-            del self._project['Issues'][-1]['closed_at']
+        return Issue(key=item.key.text,
+                     title=item.title.text,
+                     body=body,
+                     created_at=self._convert_to_iso(item.created.text),
+                     updated_at=self._convert_to_iso(item.updated.text),
+                     closed=closed,
+                     closed_at=closed_at,
+                     assignee=self.people_mapping.get(assignee),
+                     milestone_name=milestone_name,
+                     epic=epic_link,
+                     labels=dict.fromkeys(labels))
 
     def _jira_type_mapping(self, issue_type):
         return issue_type
@@ -231,8 +333,7 @@ class Project:
         #     return 'epic'
 
     def _convert_to_iso(self, timestamp):
-        dt = parse(timestamp)
-        return dt.isoformat()
+        return convert_to_iso(timestamp)
 
     def _get_epic(self, item):
         """For item, if item has an epic link, return the epic issue key."""
@@ -255,12 +356,11 @@ class Project:
         except AttributeError:
             return None
 
-    def _add_milestone(self, item):
+    def _add_milestone(self, item, issue):
         try:
             milestone = item.fixVersion.text.strip()
             self._project['Milestones'][milestone] += 1
-            # this prop will be deleted later:
-            self._project['Issues'][-1]['milestone_name'] = milestone
+            issue.milestone_name = milestone
         except AttributeError:
             pass
 
@@ -274,13 +374,11 @@ class Project:
         except AttributeError:
             return
 
-    def _add_labels(self, item):
-        issue = self._project['Issues'][-1]
-
+    def _add_labels(self, item, issue):
         try:
             self._project['Components'][item.component.text] += 1
             tmp_l = item.component.text.strip().lower()
-            issue['labels'].append(tmp_l)
+            issue.add_label(tmp_l)
         except AttributeError:
             pass
 
@@ -289,7 +387,7 @@ class Project:
                 if label.startswith('facetalk-'): continue
                 self._project['Labels'][label.text] += 1
                 tmp_l = label.text.strip().lower()
-                issue['labels'].append(tmp_l)
+                issue.add_label(tmp_l)
         except AttributeError:
             pass
 
@@ -299,62 +397,61 @@ class Project:
             flag = customfield.customfieldvalues.customfieldvalue.text.strip().lower()
             if flag:
                 self._project['Labels'][flag] += 1
-                issue['labels'].append(flag)
+                issue.add_label(flag)
         except AttributeError:
             pass
 
         try:
             self._project['Types'][item.type.text] += 1
             tmp_l = item.type.text.strip().lower()
-            issue['labels'].append(tmp_l)
+            issue.add_label(tmp_l)
         except AttributeError:
             pass
 
-    def _add_subtasks(self, item):
+    def _resolve_labels(self, issue):
+        labels, issue.labels = issue.labels, []
+        for label in labels:
+            resolved = self.label_resolver.resolve_issue_label(label)
+            if resolved:
+                issue.add_label(resolved)
+
+    def _add_subtasks(self, item, issue):
         try:
             subtaskList = ''
             for subtask in item.subtasks.subtask:
                 subtaskList = subtaskList + '- ' + subtask + '\n'
             if subtaskList != '':
                 print('-> subtaskList: ' + subtaskList)
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(item.created.text),
-                     "body": 'Subtasks:\n\n' + subtaskList})
+                issue.add_comment('Subtasks:\n\n' + subtaskList, self._convert_to_iso(item.created.text))
         except AttributeError:
             pass
 
-    def _add_parenttask(self, item):
+    def _add_parenttask(self, item, issue):
         try:
             parentTask = item.parent.text
             if parentTask != '':
                 print('-> parentTask: ' + parentTask)
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(item.created.text),
-                     "body": 'Subtask of parent task ' + parentTask})
+                issue.add_comment('Subtask of parent task ' + parentTask, self._convert_to_iso(item.created.text))
         except AttributeError:
             pass
 
-    def _add_comments(self, item):
+    def _add_comments(self, item, issue):
         try:
             for comment in item.comments.comment:
-                self._project['Issues'][-1]['comments'].append(
-                    {"created_at": self._convert_to_iso(comment.get('created')),
-                     "body": '<i><a href="' + self.jiraBaseUrl + '/secure/ViewProfile.jspa?accountid=' + comment.get('author') + '">' + self.jira_user_mapping.get(comment.get('author'), comment.get('author')) + '</a>:</i>\n' + self._htmlentitydecode(comment.text)
-                     })
+                issue.add_comment(
+                    '<i><a href="' + self.jiraBaseUrl + '/secure/ViewProfile.jspa?accountid=' + comment.get('author') + '">' + self.jira_user_mapping.get(comment.get('author'), comment.get('author')) + '</a>:</i>\n' + self._htmlentitydecode(comment.text),
+                    self._convert_to_iso(comment.get('created')))
         except AttributeError:
             pass
 
-    def _add_relationships(self, item):
-        issue = self._project['Issues'][-1]
+    def _add_relationships(self, item, issue):
         try:
             for issuelinktype in item.issuelinks.issuelinktype:
                 for outwardlink in issuelinktype.outwardlinks:
                     tmp_outward = outwardlink.get("description").replace(' ', '-')
-                    if tmp_outward not in issue:
-                        issue[tmp_outward] = []
                     for issuelink in outwardlink.issuelink:
                         for issuekey in issuelink.issuekey:
-                            issue[tmp_outward].append(issuekey.text)
+                            issue.add_link(tmp_outward, issuekey.text)
         except AttributeError:
             pass
         except KeyError:
@@ -363,11 +460,9 @@ class Project:
             for issuelinktype in item.issuelinks.issuelinktype:
                 for inwardlink in issuelinktype.inwardlinks:
                     tmp_inward = inwardlink.get("description").replace(' ', '-')
-                    if tmp_inward not in issue:
-                        issue[tmp_inward] = []
                     for issuelink in inwardlink.issuelink:
                         for issuekey in issuelink.issuekey:
-                            issue[tmp_inward].append(issuekey.text)
+                            issue.add_link(tmp_inward, issuekey.text)
         except AttributeError:
             pass
         except KeyError:
@@ -390,18 +485,13 @@ class Project:
 
         for values in extra_comments.values():
             if values:
-                issue['comments'].append({ "body": '<b>%s:</b>\n\n<div>%s</div>' % (values[0], self._htmlentitydecode(values[1])) })
+                issue.add_comment('<b>%s:</b>\n\n<div>%s</div>' % (values[0], self._htmlentitydecode(values[1])))
 
     def _htmlentitydecode(self, s):
         if s is None:
             return ''
-        s = s.replace(' ' * 8, '')
-        s = re.sub(r'(width|height)=".+?"', '', s)
-        # video (not supported) -> link
-        s = re.sub(r'<object.+?<embed (.+?)/></object>', lambda m: f'<a {m[1]}>video</a>'.replace(' src=', ' href='), s)
-        # jira api, cache the media in beacon (video has ?stream=true)
-        s = re.sub(r'/rest/api/3/attachment/content/(\d+[^"]*)', jira_attachement, s)
-        # jira url
-        s = re.sub(f'"{self.jiraBaseUrl}/browse/(.+?)"', lambda m: '"' + get_github_search_url(m[1], 'title') + '"', s)
-        return re.sub('&(%s);' % '|'.join(name2codepoint),
-                      lambda m: chr(name2codepoint[m.group(1)]), s)
+        start = perf_counter()
+        html = self.html_rewriter.rewrite(s)
+        self._html_seconds += perf_counter() - start
+        self._html_calls += 1
+        return html
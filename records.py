@@ -0,0 +1,114 @@
+import sys
+
+
+class Comment:
+    """A comment of an issue, created_at is None for comments made from issue fields."""
+    __slots__ = ('body', 'created_at')
+
+    def __init__(self, body, created_at=None):
+        self.body = body
+        self.created_at = created_at
+
+    def to_payload(self):
+        payload = {'body': self.body}
+        if self.created_at:
+            payload['created_at'] = self.created_at
+        return payload
+
+
+class Issue:
+    """
+    A Jira issue as gathered by Project, ready to be turned into an Issue Import API payload.
+    Labels are interned, as the same few strings are shared by most issues.
+    links maps the link description (e.g. 'relates-to') to the linked Jira keys.
+    """
+    __slots__ = ('key', 'title', 'body', 'created_at', 'updated_at', 'closed_at', 'closed',
+                 'assignee', 'milestone_name', 'epic', 'labels', 'comments', 'links', 'github_id')
+
+    def __init__(self, key, title, body, created_at, updated_at, closed, closed_at=None,
+                 assignee=None, milestone_name=None, epic='', labels=()):
+        self.key = key
+        self.title = title
+        self.body = body
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.closed = closed
+        self.closed_at = closed_at or None
+        self.assignee = assignee
+        self.milestone_name = milestone_name
+        self.epic = epic
+        self.labels = []
+        for label in labels:
+            self.add_label(label)
+        self.comments = []
+        self.links = {}
+        self.github_id = None
+
+    def add_label(self, label):
+        self.labels.append(sys.intern(label))
+
+    def add_comment(self, body, created_at=None):
+        self.comments.append(Comment(body, created_at))
+
+    def add_link(self, description, key):
+        self.links.setdefault(description, []).append(key)
+
+    def to_dict(self):
+        """Returns a JSON serializable copy of the record, see from_dict."""
+        data = {name: getattr(self, name) for name in Issue.__slots__}
+        data['comments'] = [[comment.body, comment.created_at] for comment in self.comments]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        issue = cls.__new__(cls)
+        for name in Issue.__slots__:
+            setattr(issue, name, data[name])
+        issue.labels = [sys.intern(label) for label in data['labels']]
+        issue.comments = [Comment(body, created_at) for body, created_at in data['comments']]
+        return issue
+
+    def to_payload(self, milestone=None, labels=None, comments=None):
+        """
+        Returns the {'issue': ..., 'comments': ...} body of an Issue Import API request.
+        milestone is the GitHub milestone number, labels and comments replace the issue's own ones.
+        """
+        issue = {'title': self.title,
+                 'body': self.body,
+                 'created_at': self.created_at,
+                 'updated_at': self.updated_at,
+                 'closed': self.closed,
+                 # remove dup, keep order
+                 'labels': list(dict.fromkeys(self.labels if labels is None else labels))}
+        if self.closed_at:
+            issue['closed_at'] = self.closed_at
+        if self.assignee:
+            issue['assignee'] = self.assignee
+        if milestone:
+            issue['milestone'] = milestone
+        return {'issue': issue,
+                'comments': [comment.to_payload() for comment in (self.comments if comments is None else comments)]}
+
+
+class CompiledIssue:
+    """
+    An issue as written by Importer.compile_payloads: its ready to send import payload,
+    with the milestone still by name, as its GitHub number is only known at upload time.
+    """
+    __slots__ = ('key', 'epic', 'updated_at', 'milestone_name', 'payload', 'github_id')
+
+    def __init__(self, key, epic, updated_at, milestone_name, payload):
+        self.key = key
+        self.epic = epic
+        self.updated_at = updated_at
+        self.milestone_name = milestone_name
+        self.payload = payload
+        self.github_id = None
+
+    def to_dict(self):
+        return {'key': self.key, 'epic': self.epic, 'updated_at': self.updated_at,
+                'milestone_name': self.milestone_name, 'payload': self.payload}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
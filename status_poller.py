@@ -0,0 +1,220 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from metrics import metrics
+
+
+class StatusCheckError(RuntimeError):
+    """The status of an import could not be checked, the import itself may well have succeeded."""
+
+
+class _PendingImport:
+    __slots__ = ('status_url', 'future', 'submitted_at', 'delay', 'checks', 'not_found', 'errors')
+
+    def __init__(self, status_url):
+        self.status_url = status_url
+        self.future = Future()
+        self.submitted_at = time.time()
+        self.delay = 0.0
+        self.checks = 0
+        self.not_found = 0
+        self.errors = 0
+
+
+class ImportStatusPoller:
+    """
+    Polls the status of all pending Issue Import API requests from one thread,
+    instead of one polling thread per import. submit() returns a Future that
+    gets the final status response, or a RuntimeError when the import failed,
+    a StatusCheckError when its status could not be checked.
+    The first check of an import is made after the import time observed so far,
+    then the delay starts at a quarter of it and doubles up to _MAX_WAIT.
+    A status url that stays 404 is given up after _MAX_NOT_FOUND checks,
+    one that can't be checked (connection errors, invalid responses) after _MAX_ERRORS,
+    both with a StatusCheckError, so the import is checked again by the next run.
+    With use_list, once many imports are tracked they are polled in rounds:
+    a single request to the import list endpoint tells which are still pending,
+    so only the finished ones are fetched.
+    """
+    _MIN_WAIT = 0.25
+    _MAX_WAIT = 5.0
+    _MAX_NOT_FOUND = 10
+    _MAX_ERRORS = 5
+    _LIST_THRESHOLD = 5
+
+    def __init__(self, client, import_url, workers=4, use_list=False):
+        self.client = client
+        self.import_url = import_url
+        self.use_list = use_list
+        # moving average of the seconds an import takes
+        self.import_time = 1.0
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._condition = threading.Condition()
+        self._queue = []
+        self._order = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, status_url, wait=None):
+        """Starts tracking an import, checked first after wait seconds (default: the observed import time)."""
+        pending = _PendingImport(status_url)
+        with self._condition:
+            first_wait = self._clamp(self.import_time) if wait is None else wait
+            self._schedule(pending, first_wait)
+            self._condition.notify()
+        return pending.future
+
+    def close(self):
+        """Stops the poller once all submitted imports are resolved."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self._pool.shutdown()
+
+    def _clamp(self, delay):
+        return min(max(delay, ImportStatusPoller._MIN_WAIT), ImportStatusPoller._MAX_WAIT)
+
+    def _schedule(self, pending, delay):
+        pending.delay = delay
+        heapq.heappush(self._queue, (time.time() + delay, next(self._order), pending))
+
+    def _backoff(self, pending):
+        pending.checks += 1
+        if pending.checks == 1:
+            delay = self._clamp(self.import_time / 4)
+        else:
+            delay = self._clamp(pending.delay * 2)
+        with self._condition:
+            self._schedule(pending, delay)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._queue:
+                        if self._closed:
+                            return
+                        self._condition.wait()
+                        continue
+                    timeout = self._queue[0][0] - time.time()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self.use_list and len(self._queue) >= ImportStatusPoller._LIST_THRESHOLD:
+                    # a round: one list request covers all imports
+                    due = [pending for _, _, pending in self._queue]
+                    self._queue.clear()
+                else:
+                    now = time.time()
+                    due = []
+                    while self._queue and self._queue[0][0] <= now:
+                        due.append(heapq.heappop(self._queue)[2])
+
+            if self.use_list and len(due) >= ImportStatusPoller._LIST_THRESHOLD:
+                due = self._skip_pending(due)
+            for pending, response in zip(due, self._pool.map(self._check, due)):
+                try:
+                    self._handle(pending, response)
+                except Exception as ex:
+                    # e.g. a response that is not the expected JSON, the future must be resolved anyway
+                    if not pending.future.done():
+                        self._error(pending, ex)
+
+    def _skip_pending(self, due):
+        """Reschedules the imports the import list reports as pending, returns the ones to check."""
+        # imports missing from the list, e.g. beyond its first page or due to clock skew, are checked one by one
+        since = datetime.fromtimestamp(min(pending.submitted_at for pending in due) - 2, timezone.utc)
+        response = self._check_list(since.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        try:
+            states = {item.get('url'): item.get('status') for item in response}
+        except (AttributeError, TypeError):
+            return due
+        to_check = []
+        with self._condition:
+            for pending in due:
+                if states.get(pending.status_url) == 'pending':
+                    pending.checks += 1
+                    self._schedule(pending, self._clamp(self.import_time / 4))
+                else:
+                    to_check.append(pending)
+        return to_check
+
+    def _check_list(self, since):
+        try:
+            response = self.client.get(self.import_url, params={'since': since, 'per_page': 100})
+        except Exception as ex:
+            print('Listing issue imports failed:', ex)
+            return None
+        if response.status_code != 200:
+            print('Listing issue imports failed due to unexpected HTTP status code:', response.status_code)
+            return None
+        try:
+            return response.json()
+        except ValueError as ex:
+            print('Listing issue imports failed:', ex)
+            return None
+
+    def _check(self, pending):
+        try:
+            return self.client.get(pending.status_url)
+        except Exception as ex:
+            return ex
+
+    def _handle(self, pending, response):
+        if isinstance(response, Exception):
+            return self._error(pending, response)
+        if response.status_code == 404:
+            pending.not_found += 1
+            if pending.not_found < ImportStatusPoller._MAX_NOT_FOUND:
+                self._backoff(pending)
+                return
+            # the url came from GitHub's own response, so the import may still finish
+            return self._fail(pending, StatusCheckError(
+                "GitHub issue import status url: {} still not found after {} checks"
+                .format(pending.status_url, pending.not_found)))
+        if response.status_code >= 500:
+            return self._error(pending, 'HTTP status code {}'.format(response.status_code))
+        if response.status_code != 200:
+            return self._fail(pending, RuntimeError(
+                "Failed to check GitHub issue import status url: {} due to unexpected HTTP status code: {}"
+                .format(pending.status_url, response.status_code)))
+
+        status = response.json()['status']
+        if status == 'pending':
+            self._backoff(pending)
+        elif status == 'imported':
+            elapsed = time.time() - pending.submitted_at
+            metrics.record('status', elapsed)
+            with self._condition:
+                # the import finished during the last delay, take the middle of it
+                self.import_time = 0.8 * self.import_time + 0.2 * (elapsed - pending.delay / 2)
+            print("Imported Issue:", response.json()['issue_url'].replace('api.github.com/repos/', 'github.com/'))
+            pending.future.set_result(response)
+        elif status == 'failed':
+            self._fail(pending, RuntimeError(
+                "Failed to import GitHub issue due to the following errors:\n{}"
+                .format(response.json())))
+        else:
+            self._fail(pending, RuntimeError(
+                "Status check for GitHub issue import returned unexpected status: '{}'"
+                .format(status)))
+
+    def _error(self, pending, ex):
+        """Checks again later after a failed check, until _MAX_ERRORS."""
+        pending.errors += 1
+        if pending.errors < ImportStatusPoller._MAX_ERRORS:
+            print('Checking GitHub issue import status url: {} failed, checking again: {}'.format(pending.status_url, ex))
+            return self._backoff(pending)
+        self._fail(pending, StatusCheckError(
+            "Failed to check GitHub issue import status url: {} after {} errors: {}"
+            .format(pending.status_url, pending.errors, ex)))
+
+    def _fail(self, pending, ex):
+        metrics.record('status', time.time() - pending.submitted_at)
+        pending.future.set_exception(ex)
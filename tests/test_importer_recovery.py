@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import requests  # noqa: E402
+from urllib3.exceptions import MaxRetryError, NewConnectionError  # noqa: E402
+
+import fake_github  # noqa: E402
+import importer  # noqa: E402
+import jira_export  # noqa: E402
+from checkpoint import ImportCheckpoint  # noqa: E402
+from project import Project  # noqa: E402
+
+Options = namedtuple('Options', 'accesstoken account repo')
+
+
+class ImporterRecoveryTest(unittest.TestCase):
+    """Uploads whose response was lost, against the fake GitHub server."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.github = fake_github.FakeGitHub()
+        self.server = fake_github.start_server(self.github)
+        self.api_url = importer.github_api_url
+        importer.github_api_url = fake_github.api_url(self.server)
+
+        parser = argparse.ArgumentParser()
+        jira_export.add_arguments(parser)
+        jira_export.write_export('export.xml', parser.parse_args(['--issues', '2', '--epic-every', '0']))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.project = Project(jira_export.PROJECT, '3', 'https://issues.example.org')
+            self.project.add_files('export.xml')
+        self.checkpoint = ImportCheckpoint('checkpoint.sqlite')
+
+    def tearDown(self):
+        self.checkpoint.close()
+        self.server.shutdown()
+        self.server.server_close()
+        importer.github_api_url = self.api_url
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _import(self, failures=None):
+        """Imports the project, failures maps Jira keys to the error of their upload."""
+        imp = importer.Importer(Options('token', 'test', 'test'), self.project, self.checkpoint)
+        post = imp.client.post
+
+        def failing_post(url, **kwargs):
+            error = (failures or {}).get(kwargs['json']['issue']['title'].split(']')[0][1:])
+            if error == 'lost':
+                post(url, **kwargs)
+                raise requests.ReadTimeout('response lost')
+            if error == 'server error':
+                post(url, **kwargs)
+                response = requests.Response()
+                response.status_code = 502
+                return response
+            if error == 'refused':
+                raise requests.ConnectionError(MaxRetryError(None, url, NewConnectionError(None, 'refused')))
+            return post(url, **kwargs)
+
+        imp.client.post = failing_post
+        with contextlib.redirect_stdout(io.StringIO()):
+            imp.import_issues()
+
+    def test_refused_upload_is_not_matched(self):
+        self._import({'BENCH-1': 'lost', 'BENCH-2': 'refused'})
+        self.assertEqual(self.checkpoint.state('BENCH-1'), ImportCheckpoint.SUBMITTED)
+        self.assertEqual(self.checkpoint.state('BENCH-2'), ImportCheckpoint.FAILED)
+
+        self._import()
+        self.assertEqual(self.checkpoint.imported(), {'BENCH-1': 1, 'BENCH-2': 2})
+        self.assertEqual(len(self.github.issues), 2)
+        self.assertIn('/browse/BENCH-1"', self.github.issues[1]['body'])
+
+    def test_server_error_upload_is_recovered(self):
+        self._import({'BENCH-1': 'server error'})
+        self.assertEqual(self.checkpoint.state('BENCH-1'), ImportCheckpoint.SUBMITTED)
+        self.assertEqual(self.checkpoint.imported(), {'BENCH-2': 2})
+
+        self._import()
+        self.assertEqual(self.checkpoint.imported(), {'BENCH-1': 1, 'BENCH-2': 2})
+        self.assertEqual(len(self.github.issues), 2)
+
+    def test_unmatched_imports_are_not_guessed(self):
+        # both responses are lost, only one of the uploads is on GitHub
+        self._import({'BENCH-1': 'lost', 'BENCH-2': 'lost'})
+        self.github.imports.pop(2)
+        self.github.issues.pop(2)
+
+        self._import()
+        self.assertEqual(self.checkpoint.state('BENCH-1'), ImportCheckpoint.SUBMITTED)
+        self.assertEqual(self.checkpoint.state('BENCH-2'), ImportCheckpoint.SUBMITTED)
+        self.assertEqual(len(self.github.issues), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
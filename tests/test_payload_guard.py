@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payload_guard import MAX_BODY_LENGTH, PayloadGuard
+
+
+class PayloadGuardTest(unittest.TestCase):
+
+    def test_follow_up_body_within_limit(self):
+        comment = {'body': 'x' * (MAX_BODY_LENGTH + 100), 'created_at': '2023-03-01T12:00:00Z'}
+        body = PayloadGuard.follow_up_body(comment)
+        self.assertEqual(len(body), MAX_BODY_LENGTH)
+        self.assertTrue(body.startswith('<i>Originally posted on 2023-03-01T12:00:00Z</i>\n'))
+
+    def test_follow_up_body_at_limit(self):
+        # a body that fit the payload may not fit once the date is added
+        comment = {'body': 'x' * MAX_BODY_LENGTH, 'created_at': '2023-03-01T12:00:00Z'}
+        self.assertEqual(len(PayloadGuard.follow_up_body(comment)), MAX_BODY_LENGTH)
+
+    def test_short_follow_up_body_kept(self):
+        comment = {'body': 'short', 'created_at': '2023-03-01T12:00:00Z'}
+        self.assertEqual(PayloadGuard.follow_up_body(comment), '<i>Originally posted on 2023-03-01T12:00:00Z</i>\nshort')
+        self.assertEqual(PayloadGuard.follow_up_body({'body': 'short'}), 'short')
+
+    def test_fit_trims_bodies(self):
+        payload = {'issue': {'body': 'x' * (MAX_BODY_LENGTH + 1)}, 'comments': [{'body': 'y' * (MAX_BODY_LENGTH * 2)}]}
+        payload, follow_ups = PayloadGuard().fit(payload)
+        self.assertEqual(follow_ups, [])
+        self.assertEqual(len(payload['issue']['body']), MAX_BODY_LENGTH)
+        self.assertEqual(len(payload['comments'][0]['body']), MAX_BODY_LENGTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,13 @@
-from lxml import objectify
+from lxml import etree, objectify
 from urllib.parse import urlencode
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from dateutil.parser import parse
+from functools import lru_cache
 import os
 import glob
+import gzip
+import re
 
 def _exists(fn):
     if not os.path.exists(fn):
@@ -15,7 +21,7 @@ def fetch_labels_mapping():
     if not _exists(fn):
         return {}
     with open(fn) as file:
-        entry = [line.split("=") for line in file.read().splitlines() if line and not line.startswith('#')]
+        entry = [line.split("=", 1) for line in file.read().splitlines() if line and not line.startswith('#')]
     return {key.strip(): value.strip() for key, value in entry}
 
 
@@ -45,42 +51,133 @@ def fetch_jira_user_mapping():
     return {key.strip(): value.strip() for key, value in entry} # {uuid: name}
 
 
-def _map_label(label, labels_mapping):
-    if label in labels_mapping:
-        return labels_mapping[label]
-    else:
-        return label
-
-
-def _is_label_approved(label, approved_labels):
-    return label in approved_labels
-
-
-def convert_label(label, labels_mappings, approved_labels) -> str or None:
-    mapped_label = _map_label(label, labels_mappings)
-
-    if _is_label_approved(mapped_label, approved_labels):
-        return mapped_label
-    return None
+# Jira exports, as written by fetch_issues.py per compression
+XML_SUFFIXES = {'none': '.xml', 'gzip': '.xml.gz', 'zstd': '.xml.zst'}
 
 
-def read_xml_file(file_path):
-    with open(file_path) as file:
-        return objectify.fromstring(file.read())
-
-
-def read_xml_files(file_path):
+def list_xml_files(file_path):
     files = list()
     for file_name in file_path.split(';'):
         if os.path.isdir(file_name):
-            xml_files = glob.glob(file_name + '/*.xml')
-            for file in xml_files:
-                files.append(read_xml_file(file))
+            files.extend(sorted(name for suffix in XML_SUFFIXES.values()
+                                for name in glob.glob(file_name + '/*' + suffix)))
         else:
-            files.append(read_xml_file(file_name))
-
+            files.append(file_name)
     return files
 
 
+def xml_compression(file_name):
+    """The compression of an export, from its file name."""
+    if file_name.endswith('.gz'):
+        return 'gzip'
+    if file_name.endswith('.zst'):
+        return 'zstd'
+    return 'none'
+
+
+def open_xml_file(file_name, mode='rb', compression=None):
+    """
+    Opens an export as a binary stream, compressing or decompressing .xml.gz
+    and .xml.zst files on the fly. zstd needs the zstandard package.
+    """
+    compression = compression or xml_compression(file_name)
+    if compression == 'gzip':
+        return gzip.open(file_name, mode, compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError('Reading or writing %s needs the zstandard package: pip install zstandard' % file_name)
+        return zstandard.open(file_name, mode)
+    if compression != 'none':
+        raise RuntimeError('Unknown compression %s, expected one of %s' % (compression, ', '.join(XML_SUFFIXES)))
+    return open(file_name, mode)
+
+
+def iter_xml_file(file_name):
+    """
+    Yields the <item> elements of one Jira XML export, one at a time.
+    Compressed exports are decompressed while they are parsed.
+    Every item is cleared once the caller is done with it, and the already
+    processed siblings are dropped from the tree, so memory stays flat.
+    """
+    if xml_compression(file_name) == 'none':
+        yield from _iter_items(file_name)
+    else:
+        with open_xml_file(file_name) as source:
+            yield from _iter_items(source)
+
+
+def _iter_items(source):
+    context = etree.iterparse(source, events=('end',), tag='item', remove_blank_text=True, huge_tree=True)
+    context.set_element_class_lookup(objectify.ObjectifyElementClassLookup())
+    for _, item in context:
+        yield item
+        item.clear()
+        parent = item.getparent()
+        while item.getprevious() is not None:
+            parent.remove(item.getprevious())
+    del context
+
+
+_MONTHS = {name: number for number, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+# the RFC-822 style used by Jira XML exports, e.g. "Mon, 13 Mar 2023 10:11:12 +0000"
+_JIRA_TIMESTAMP = re.compile(r'(?:[A-Z][a-z]{2}, )?(\d{1,2}) ([A-Z][a-z]{2}) (\d{4}) (\d{2}):(\d{2}):(\d{2}) ([+-])(\d{2})(\d{2})$')
+
+# calls: all conversions, fast/fallback: cache misses parsed directly or by dateutil
+_timestamp_counters = Counter()
+
+
+@lru_cache(maxsize=65536)
+def _parse_timestamp(timestamp):
+    m = _JIRA_TIMESTAMP.match(timestamp)
+    if m and m[2] in _MONTHS:
+        offset = timedelta(hours=int(m[8]), minutes=int(m[9]))
+        try:
+            dt = datetime(int(m[3]), _MONTHS[m[2]], int(m[1]), int(m[4]), int(m[5]), int(m[6]),
+                          tzinfo=timezone(-offset if m[7] == '-' else offset))
+            _timestamp_counters['fast'] += 1
+            return dt.isoformat()
+        except ValueError:
+            pass
+    _timestamp_counters['fallback'] += 1
+    return parse(timestamp).isoformat()
+
+
+def convert_to_iso(timestamp):
+    """Converts a Jira timestamp to ISO 8601, parsing the usual Jira format directly and caching the results."""
+    _timestamp_counters['calls'] += 1
+    return _parse_timestamp(timestamp)
+
+
+def to_utc(timestamp):
+    """
+    Parses an ISO 8601 timestamp into an aware datetime in UTC, so any two compare.
+    A timestamp without time zone, e.g. from the dateutil fallback, is taken as UTC.
+    """
+    dt = datetime.fromisoformat(timestamp)
+    return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def timestamp_stats(reset=False):
+    """
+    Returns the conversion counters: calls, cache hits and misses, and how the misses were parsed.
+    With reset, the counters are cleared afterwards.
+    """
+    stats = dict.fromkeys(('calls', 'fast', 'fallback'), 0)
+    stats.update(_timestamp_counters)
+    if reset:
+        _timestamp_counters.clear()
+    stats['misses'] = stats['fast'] + stats['fallback']
+    stats['hits'] = stats['calls'] - stats['misses']
+    return stats
+
+
+def merge_timestamp_stats(stats):
+    """Adds the counters of another process, e.g. a parse worker."""
+    _timestamp_counters.update({key: stats[key] for key in ('calls', 'fast', 'fallback')})
+
+
 def get_github_search_url(term, field='comment'):
     return '../issues?' + urlencode({'q': f'in:{field} "{term}"'})